@@ -0,0 +1,221 @@
+import hashlib
+from functools import wraps
+from flask import Blueprint, jsonify, request, abort, current_app
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from models import db, Book, Review, Collection
+from pagination import keyset_paginate
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_BATCH = 100
+
+BOOK_FIELDS = {
+    'id': lambda book: book.id,
+    'title': lambda book: book.title,
+    'author': lambda book: book.author,
+    'publisher': lambda book: book.publisher,
+    'year': lambda book: book.year,
+    'pages': lambda book: book.pages,
+    'description': lambda book: book.description,
+    'genres': lambda book: [genre.name for genre in book.genres],
+    'cover_url': lambda book: book.cover.url if book.cover else None,
+    'average_rating': lambda book: book.average_rating,
+    'reviews_count': lambda book: book.reviews_count,
+    'version': lambda book: book.version,
+}
+
+REVIEW_FIELDS = {
+    'id': lambda review: review.id,
+    'book_id': lambda review: review.book_id,
+    'user_id': lambda review: review.user_id,
+    'author': lambda review: review.user.full_name,
+    'rating': lambda review: review.rating,
+    'text': lambda review: review.text,
+    'timestamp': lambda review: review.timestamp.isoformat(),
+    'version': lambda review: review.version,
+}
+
+COLLECTION_FIELDS = {
+    'id': lambda collection: collection.id,
+    'name': lambda collection: collection.name,
+    'book_ids': lambda collection: sorted(book.id for book in collection.books),
+    'version': lambda collection: collection.version,
+}
+
+def api_error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+@bp.errorhandler(400)
+@bp.errorhandler(403)
+@bp.errorhandler(404)
+def handle_api_error(err):
+    return api_error(err.code, err.description)
+
+def api_login_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return api_error(401, 'Требуется аутентификация')
+        return f(*args, **kwargs)
+    return wrapper
+
+def parse_ids(raw):
+    if raw is None:
+        return None
+    try:
+        ids = sorted({int(part) for part in raw.split(',') if part.strip()})
+    except ValueError:
+        abort(400, 'Параметр ids должен содержать целые числа через запятую')
+    if not ids or len(ids) > MAX_BATCH:
+        abort(400, f'Параметр ids должен содержать от 1 до {MAX_BATCH} идентификаторов')
+    return ids
+
+def parse_fields(raw, available):
+    if not raw:
+        return list(available)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(400, f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+def parse_limit(raw, default=20):
+    # Размер страницы от клиента: от 1 до MAX_BATCH (отрицательный LIMIT в SQLite означает «без ограничения»)
+    try:
+        limit = int(raw) if raw is not None else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, MAX_BATCH))
+
+def requested_limit():
+    return parse_limit(request.args.get('limit'))
+
+def requested_ids():
+    return parse_ids(request.args.get('ids'))
+
+def requested_fields(available):
+    return parse_fields(request.args.get('fields'), available)
+
+def serialize(obj, fields, available):
+    return {field: available[field](obj) for field in fields}
+
+def versions_etag(kind, versions, fields):
+    # ETag собирается из (id, version) строк - для проверки достаточно одного лёгкого запроса
+    payload = repr((kind, sorted(versions), fields)).encode()
+    return hashlib.md5(payload).hexdigest()
+
+def conditional_response(etag, build):
+    # Тело строится (и строки загружаются) только если у клиента устаревшая версия
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def conditional_batch(kind, version_query, load, fields, available):
+    versions = [tuple(row) for row in db.session.execute(version_query)]
+    return conditional_response(
+        versions_etag(kind, versions, fields),
+        lambda: {'items': [serialize(obj, fields, available) for obj in load()]},
+    )
+
+def conditional_json(payload):
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/books', methods=['GET'])
+@api_login_required
+def books():
+    fields = requested_fields(BOOK_FIELDS)
+    options = [selectinload(Book.genres), selectinload(Book.cover)]
+    ids = requested_ids()
+    if ids is not None:
+        return conditional_batch(
+            'books',
+            select(Book.id, Book.version).where(Book.id.in_(ids)),
+            lambda: db.session.execute(select(Book).options(*options).where(Book.id.in_(ids)).order_by(Book.id)).scalars(),
+            fields, BOOK_FIELDS,
+        )
+    per_page = requested_limit()
+    page = keyset_paginate(select(Book).options(*options), [Book.year, Book.id],
+                           cursor=request.args.get('cursor'), per_page=per_page)
+    return conditional_json({
+        'items': [serialize(book, fields, BOOK_FIELDS) for book in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+@bp.route('/books/<int:book_id>', methods=['GET'])
+@api_login_required
+def book(book_id):
+    fields = requested_fields(BOOK_FIELDS)
+    version = db.session.execute(select(Book.id, Book.version).where(Book.id == book_id)).first()
+    if version is None:
+        abort(404, f'Книга с id {book_id} не найдена')
+    return conditional_response(
+        versions_etag('book', [tuple(version)], fields),
+        lambda: serialize(
+            db.session.execute(
+                select(Book).options(selectinload(Book.genres), selectinload(Book.cover)).where(Book.id == book_id)
+            ).scalar_one(),
+            fields, BOOK_FIELDS,
+        ),
+    )
+
+@bp.route('/reviews', methods=['GET'])
+@api_login_required
+def reviews():
+    fields = requested_fields(REVIEW_FIELDS)
+    ids = requested_ids()
+    book_id = request.args.get('book_id', type=int)
+    if ids is not None:
+        return conditional_batch(
+            'reviews',
+            select(Review.id, Review.version).where(Review.id.in_(ids)),
+            lambda: db.session.execute(
+                select(Review).options(selectinload(Review.user)).where(Review.id.in_(ids)).order_by(Review.id)
+            ).scalars(),
+            fields, REVIEW_FIELDS,
+        )
+    if book_id is None:
+        abort(400, 'Укажите параметр ids или book_id')
+    # Рецензии книги - постранично от новых к старым, как на странице книги
+    page = keyset_paginate(
+        select(Review).options(selectinload(Review.user)).where(Review.book_id == book_id),
+        [Review.timestamp, Review.id],
+        cursor=request.args.get('cursor'), per_page=requested_limit(),
+    )
+    return conditional_json({
+        'items': [serialize(review, fields, REVIEW_FIELDS) for review in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+@bp.route('/collections', methods=['GET'])
+@api_login_required
+def collections():
+    if not current_user.can('show_collection'):
+        abort(403, 'У вас нет доступа к подборкам')
+    fields = requested_fields(COLLECTION_FIELDS)
+    condition = Collection.user_id == current_user.id
+    ids = requested_ids()
+    if ids is not None:
+        condition = condition & Collection.id.in_(ids)
+    return conditional_batch(
+        'collections',
+        select(Collection.id, Collection.version).where(condition),
+        lambda: db.session.execute(
+            select(Collection).options(selectinload(Collection.books)).where(condition).order_by(Collection.id)
+        ).scalars(),
+        fields, COLLECTION_FIELDS,
+    )
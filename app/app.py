@@ -2,43 +2,38 @@ from flask import Flask, render_template, redirect, url_for, request, flash, sen
 from flask_login import login_required, current_user
 from models import db, Cover, Book, Collection
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import selectinload
 from flask_migrate import Migrate
-from auth import bp as auth_bp, init_login_manager
-from tools import ImageSaver
-import os
-
-app = Flask(__name__)
-# application = app
-
-app.config.from_pyfile('configure.py')
-
-db.init_app(app)
-migrate = Migrate(app, db)
-
-init_login_manager(app)
-
-from auth import bp as bp_auth
+from auth import bp as bp_auth, init_login_manager
 from books_func import bp as bp_books
 from review import bp as bp_review
 from collection import bp as bp_collection
+from search import bp as bp_search
+from api import bp as bp_api
+from export import bp as bp_export
+from tools import ImageSaver, DEFAULT_COVER_MAX_SIZE
+from commands import init_commands
+from pagination import keyset_paginate
+from covers import send_cover
+from search_index import include_object
+from facets import facet_summary, filter_books
+from instrumentation import init_instrumentation
+from page_cache import cached_fragment
+from leaderboards import OVERALL, render_leaderboards
+from db_routing import init_db_routing
+from reference import init_reference_data
+from startup import init_startup
 
-app.register_blueprint(bp_auth)
-app.register_blueprint(bp_books)
-app.register_blueprint(bp_review)
-app.register_blueprint(bp_collection)
+migrate = Migrate()
 
-@app.errorhandler(SQLAlchemyError)
-def handle_sqlalchemy_error(err):
-    error_msg = ('Возникла ошибка при подключении к базе данных. '
-                 'Повторите попытку позже.')
-    return f'{error_msg} (Подробнее: {err})', 500
-
-@app.route('/')
-def index():
-    page = request.args.get('page', 1, type=int)
+def render_catalog(cursor, filters):
     per_page = 10
-    books = db.session.query(Book).order_by(Book.year.desc()).paginate(page=page, per_page=per_page)
-    user_collections = db.session.query(Collection).filter_by(user_id=current_user.id).all() if current_user.is_authenticated else []
+    # Жанры подгружаются одним запросом на всю страницу, рейтинги хранятся в самой книге
+    books = keyset_paginate(
+        filter_books(db.select(Book).options(selectinload(Book.genres)), filters['genre'], filters['decade']),
+        [Book.year, Book.id],
+        cursor=cursor, per_page=per_page,
+    )
     books_with_details = []
     for book in books.items:
         genres = [genre.name for genre in book.genres]
@@ -46,15 +41,77 @@ def index():
             'id': book.id,
             'title': book.title,
             'year': book.year,
+            'cover_id': book.cover_id,
             'genres': genres,
             'average_rating': book.average_rating,
             'reviews_count': book.reviews_count
         })
-    return render_template('index.html', books=books_with_details, books_pog=books, user_collections=user_collections)
+    return render_template('books/_catalog.html', books=books_with_details, books_pog=books,
+                           facets=facet_summary(), filters=filters)
+
+def index():
+    cursor = request.args.get('cursor')
+    filters = {
+        'genre': request.args.getlist('genre', type=int),
+        'decade': request.args.get('decade', type=int),
+    }
+    user_collections = db.session.query(Collection).filter_by(user_id=current_user.id).all() if current_user.is_authenticated else []
+    # Таблица каталога одинакова для всех пользователей с одинаковыми правами
+    catalog = cached_fragment('index', (cursor, tuple(sorted(filters['genre'])), filters['decade']),
+                              lambda: render_catalog(cursor, filters))
+    # При выборе одного жанра показываются рейтинги этого жанра
+    board_genre = filters['genre'][0] if len(filters['genre']) == 1 else OVERALL
+    leaderboards = cached_fragment('leaderboards', (board_genre,), lambda: render_leaderboards(board_genre))
+    return render_template('index.html', catalog=catalog, leaderboards=leaderboards, user_collections=user_collections)
 
-@app.route('/images/<image_id>')
 def image(image_id):
-    img = db.get_or_404(Cover, image_id)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], img.storage_filename)
+    return send_cover(image_id, request.args.get('size'))
+
+def handle_sqlalchemy_error(err):
+    error_msg = ('Возникла ошибка при подключении к базе данных. '
+                 'Повторите попытку позже.')
+    return f'{error_msg} (Подробнее: {err})', 500
+
+def handle_request_too_large(err):
+    flash('Размер загружаемого файла слишком велик.', 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+def create_app():
+    # Ничего не открывает при импорте модуля: gunicorn --preload вызывает фабрику в мастере,
+    # прогрев (PRELOAD_WARMUP) выполняется там же, а соединения с БД воркеры открывают сами
+    app = Flask(__name__)
+
+    app.config.from_pyfile('configure.py')
+    # Переменные окружения FLASK_* переопределяют configure.py (например, FLASK_SQLALCHEMY_DATABASE_URI)
+    app.config.from_prefixed_env()
+    # Тело запроса больше лимита обложки (с запасом на поля формы) отклоняется до разбора multipart
+    app.config.setdefault('COVER_MAX_SIZE', DEFAULT_COVER_MAX_SIZE)
+    app.config.setdefault('MAX_CONTENT_LENGTH', app.config['COVER_MAX_SIZE'] + 1024 * 1024)
+
+    init_db_routing(app)
+    db.init_app(app)
+    migrate.init_app(app, db, include_object=include_object)
+
+    init_login_manager(app)
+    init_commands(app)
+    init_instrumentation(app)
+    init_reference_data(app)
+
+    app.register_blueprint(bp_auth)
+    app.register_blueprint(bp_books)
+    app.register_blueprint(bp_review)
+    app.register_blueprint(bp_collection)
+    app.register_blueprint(bp_search)
+    app.register_blueprint(bp_api)
+    app.register_blueprint(bp_export)
+
+    app.register_error_handler(SQLAlchemyError, handle_sqlalchemy_error)
+    app.register_error_handler(413, handle_request_too_large)
+
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/images/<int:image_id>', view_func=image)
+
+    init_startup(app)
+    return app
 
 
@@ -0,0 +1,285 @@
+"""Асинхронный сервер только для чтения: список и карточка книги в API и файлы обложек.
+
+Отвечает на те же URL, что и синхронное приложение, и использует те же модели.
+Фронтовой прокси отправляет сюда GET-запросы к /api/v1/books и /images/,
+всё остальное обслуживает Flask:
+
+    uvicorn async_app:application --port 8001
+
+Медленный клиент, скачивающий обложку, занимает здесь корутину, а не поток воркера.
+"""
+import asyncio
+import os
+import re
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag, generate_etag
+from app import create_app
+from models import Book, Cover, User
+from api import BOOK_FIELDS, parse_ids, parse_fields, parse_limit, serialize, versions_etag
+from pagination import keyset_query, keyset_page
+from covers import cover_cache_control, cover_files, offload_header
+from thumbnails import COVER_SIZES, derivative_filename
+from db_routing import engine_options
+
+CHUNK_SIZE = 64 * 1024
+# Асинхронные драйверы для диалектов синхронного приложения
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+}
+
+def async_database_uri(config):
+    # Чтение идёт с реплики, если она настроена
+    uri = config.get('SQLALCHEMY_ASYNC_DATABASE_URI')
+    if uri:
+        return uri
+    url = make_url(config.get('SQLALCHEMY_REPLICA_URI') or config['SQLALCHEMY_DATABASE_URI'])
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {key: values[0] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+    @property
+    def base_url(self):
+        host = self.headers.get('host') or '{}:{}'.format(*self.scope['server'])
+        return f"{self.scope.get('scheme', 'http')}://{host}{self.scope.get('root_path', '')}"
+
+    def if_none_match(self, etag):
+        return parse_etags(self.headers.get('if-none-match')).contains(etag)
+
+class Response:
+    def __init__(self, status=200, body=b'', content_type=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers['Content-Type'] = content_type
+
+    async def send(self, send, request):
+        headers = dict(self.headers)
+        if self.status != 304:
+            headers.setdefault('Content-Length', str(len(self.body)))
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        })
+        body = self.body if request.method != 'HEAD' and self.status != 304 else b''
+        await send({'type': 'http.response.body', 'body': body})
+
+class FileResponse(Response):
+    # Файл читается частями в пуле потоков, пока клиент принимает предыдущую часть
+    def __init__(self, path, size, headers):
+        super().__init__(200, headers=headers)
+        self.path = path
+        self.size = size
+
+    async def send(self, send, request):
+        self.headers['Content-Length'] = str(self.size)
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in self.headers.items()],
+        })
+        if request.method == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        f = await asyncio.to_thread(open, self.path, 'rb')
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
+        finally:
+            await asyncio.to_thread(f.close)
+
+class AsyncCatalog:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        uri = async_database_uri(self.config)
+        self.engine = create_async_engine(uri, **engine_options(uri, self.config))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.routes = [
+            (re.compile(r'^/api/v1/books$'), self.books),
+            (re.compile(r'^/api/v1/books/(\d+)$'), self.book),
+            (re.compile(r'^/images/(\d+)$'), self.image),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        request = Request(scope)
+        try:
+            response = await self.dispatch(request)
+        except HTTPException as err:
+            response = self.json({'error': err.description}, err.code)
+        await response.send(send, request)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.json({'error': 'Метод не поддерживается'}, 405)
+        for pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                return await handler(request, *[int(group) for group in match.groups()])
+        return self.json({'error': 'Не найдено'}, 404)
+
+    def dump(self, payload):
+        # Тот же JSON-провайдер, что у jsonify, - тела ответов совпадают с синхронным API
+        return self.flask_app.json.response(payload).get_data()
+
+    def json(self, payload, status=200):
+        return Response(status, self.dump(payload), 'application/json')
+
+    def conditional(self, request, etag, build):
+        # Как api.conditional_response: тело строится только при устаревшей версии у клиента
+        headers = {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'}
+        if request.if_none_match(etag):
+            return Response(304, headers=headers)
+        response = self.json(build())
+        response.headers.update(headers)
+        return response
+
+    def serialize_books(self, request, books, fields):
+        # cover_url строится через url_for, поэтому нужен контекст запроса Flask (без обращений к БД)
+        with self.flask_app.test_request_context(request.path, base_url=request.base_url):
+            return [serialize(book, fields, BOOK_FIELDS) for book in books]
+
+    async def authenticated(self, request, session):
+        # Та же подписанная cookie-сессия, что у Flask-Login; remember-cookie здесь не поддерживается
+        cookie = SimpleCookie(request.headers.get('cookie', ''))
+        morsel = cookie.get(self.config['SESSION_COOKIE_NAME'])
+        if morsel is None:
+            return False
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            data = serializer.loads(morsel.value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return False
+        user_id = data.get('_user_id')
+        return user_id is not None and await session.get(User, int(user_id)) is not None
+
+    async def books(self, request):
+        fields = parse_fields(request.args.get('fields'), BOOK_FIELDS)
+        options = [selectinload(Book.genres), selectinload(Book.cover)]
+        async with self.sessions() as session:
+            if not await self.authenticated(request, session):
+                return self.json({'error': 'Требуется аутентификация'}, 401)
+            ids = parse_ids(request.args.get('ids'))
+            if ids is not None:
+                versions = [tuple(row) for row in await session.execute(
+                    select(Book.id, Book.version).where(Book.id.in_(ids)))]
+                etag = versions_etag('books', versions, fields)
+                if request.if_none_match(etag):
+                    return self.conditional(request, etag, None)
+                books = (await session.scalars(
+                    select(Book).options(*options).where(Book.id.in_(ids)).order_by(Book.id))).all()
+                return self.conditional(request, etag, lambda: {'items': self.serialize_books(request, books, fields)})
+
+            per_page = parse_limit(request.args.get('limit'))
+            columns = [Book.year, Book.id]
+            page_query, decoded = keyset_query(select(Book).options(*options), columns,
+                                               cursor=request.args.get('cursor'), per_page=per_page)
+            page = keyset_page(list(await session.scalars(page_query)), columns, decoded, per_page)
+            body = self.dump({
+                'items': self.serialize_books(request, page.items, fields),
+                'next_cursor': page.next_cursor,
+                'prev_cursor': page.prev_cursor,
+            })
+        # Как api.conditional_json: ETag по содержимому ответа
+        etag = generate_etag(body)
+        headers = {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'}
+        if request.if_none_match(etag):
+            return Response(304, headers=headers)
+        return Response(200, body, 'application/json', headers)
+
+    async def book(self, request, book_id):
+        fields = parse_fields(request.args.get('fields'), BOOK_FIELDS)
+        async with self.sessions() as session:
+            if not await self.authenticated(request, session):
+                return self.json({'error': 'Требуется аутентификация'}, 401)
+            version = (await session.execute(select(Book.id, Book.version).where(Book.id == book_id))).first()
+            if version is None:
+                return self.json({'error': f'Книга с id {book_id} не найдена'}, 404)
+            etag = versions_etag('book', [tuple(version)], fields)
+            if request.if_none_match(etag):
+                return self.conditional(request, etag, None)
+            book = (await session.scalars(
+                select(Book).options(selectinload(Book.genres), selectinload(Book.cover)).where(Book.id == book_id)
+            )).one()
+        return self.conditional(request, etag, lambda: self.serialize_books(request, [book], fields)[0])
+
+    async def cover_file(self, image_id):
+        # Общий с синхронной частью кэш id -> файл
+        info = cover_files.get(image_id)
+        if info is None:
+            async with self.sessions() as session:
+                cover = await session.get(Cover, image_id)
+            if cover is None:
+                return None
+            info = (cover.storage_filename, cover.md5_hash, cover.mime_type)
+            cover_files.set(image_id, info)
+        return info
+
+    async def image(self, request, image_id):
+        info = await self.cover_file(image_id)
+        if info is None:
+            return Response(404, b'Not Found', 'text/plain')
+        storage_filename, md5_hash, mime_type = info
+
+        upload_folder = self.config['UPLOAD_FOLDER']
+        size = request.args.get('size')
+        derivative = None
+        if size in COVER_SIZES:
+            derivative = derivative_filename(storage_filename, size)
+            if await asyncio.to_thread(os.path.exists, os.path.join(upload_folder, derivative)):
+                storage_filename = derivative
+                md5_hash = f'{md5_hash}.{size}'
+            else:
+                derivative = None
+
+        headers = {
+            'ETag': quote_etag(md5_hash),
+            'Cache-Control': cover_cache_control(size, derivative),
+        }
+        if request.if_none_match(md5_hash):
+            return Response(304, headers=headers)
+        header = offload_header(self.config, storage_filename)
+        if header is not None:
+            headers[header[0]] = header[1]
+            return Response(200, content_type=mime_type, headers=headers)
+
+        path = os.path.join(upload_folder, storage_filename)
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            return Response(404, b'Not Found', 'text/plain')
+        headers['Content-Type'] = mime_type
+        return FileResponse(path, stat.st_size, headers)
+
+application = AsyncCatalog(create_app())
@@ -1,12 +1,22 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import LoginManager, login_user, logout_user, login_required,current_user
 from models import db, User
+from cache import LRUCache
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import HashingBusy, verify_password, needs_rehash, rehash_password
+from throttle import login_throttled
 import hashlib
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# Снимок колонок пользователя по id: страницы не делают SELECT users на каждый запрос.
+# Кэш у каждого процесса свой: изменения из других воркеров и прямым SQL видны только
+# после истечения TTL, поэтому он держится коротким
+USER_CACHE_TTL = 5
+user_cache = LRUCache(maxsize=10000, ttl=USER_CACHE_TTL)
+
 def init_login_manager(app):
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -14,10 +24,26 @@ def init_login_manager(app):
     login_manager.login_message_category = 'warning'
     login_manager.user_loader(load_user)
     login_manager.init_app(app)
+    user_cache.ttl = app.config.get('USER_CACHE_TTL', USER_CACHE_TTL)
 
 def load_user(user_id):
-    user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar()
-    return user
+    data = user_cache.get(str(user_id))
+    if data is None:
+        user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar()
+        if user is not None:
+            user_cache.set(str(user_id), {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        return user
+    # Восстанавливаем объект из снимка и привязываем к сессии без запроса к БД
+    user = User(**data)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    # Смена role_id (как и любое изменение пользователя через ORM) сбрасывает снимок в этом процессе;
+    # остальные воркеры увидят её через USER_CACHE_TTL
+    user_cache.delete(str(target.id))
 
 def checkRole(action):
     def decorator(f):
@@ -30,15 +56,36 @@ def checkRole(action):
         return wrapper
     return decorator
 
+def upgrade_password_hash(user, password):
+    # Пароль известен только в момент входа - тогда и переводим хэш на текущие параметры
+    if not needs_rehash(user.password_hash):
+        return
+    try:
+        user.password_hash = rehash_password(password)
+    except HashingBusy:
+        return
+    db.session.commit()
+
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('login')
         password = request.form.get('password')
         if username and password:
+            wait = login_throttled(request.remote_addr, username)
+            if wait:
+                flash(f'Слишком много попыток входа. Повторите через {wait} с.', 'danger')
+                return render_template('auth/login.html'), 429, {'Retry-After': str(wait)}
             user = db.session.query(User).filter_by(username=username).first()
             if user:
-                if check_password_hash(user.password_hash, password):
+                # Хэш считается в ограниченном пуле: при переполнении очереди вход откладывается, а не занимает воркер
+                try:
+                    valid = verify_password(user.password_hash, password)
+                except HashingBusy:
+                    flash('Сервер перегружен, повторите попытку входа позже.', 'danger')
+                    return render_template('auth/login.html'), 503, {'Retry-After': '1'}
+                if valid:
+                    upgrade_password_hash(user, password)
                     login_user(user)
                     flash('Вы успешно аутентифицированы.', 'success')
                     next = request.args.get('next')
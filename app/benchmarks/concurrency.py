@@ -0,0 +1,152 @@
+"""Сравнение синхронного и асинхронного режимов под медленными клиентами.
+
+Запуск из каталога app:
+
+    python -m benchmarks.concurrency --threads 4 --slow-clients 16
+
+Синхронное приложение обслуживается пулом из --threads потоков (как gunicorn
+--threads), асинхронное - одним процессом uvicorn. Медленные клиенты
+непрерывно скачивают большую обложку, читая её маленькими порциями; в это
+время быстрый клиент запрашивает /api/v1/books/<id>, и для него печатаются
+перцентили задержки. В синхронном режиме медленные загрузки занимают все
+потоки и быстрые запросы ждут в очереди.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import configure_environment, percentile
+
+def serve_sync(port, threads):
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+    from app import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+        # Ограниченный пул потоков вместо потока на соединение
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    make_server('127.0.0.1', port, create_app(), server_class=PooledWSGIServer, handler_class=QuietHandler).serve_forever()
+
+def serve_async(port):
+    import uvicorn
+    uvicorn.run('async_app:application', host='127.0.0.1', port=port, log_level='warning')
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Сервер на порту {port} не запустился')
+
+def slow_download(port, path, chunk, delay, stop):
+    # Маленький приёмный буфер и паузы между чтениями - клиент на медленном канале
+    while not stop.is_set():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, chunk)
+        try:
+            sock.connect(('127.0.0.1', port))
+            sock.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+            while not stop.is_set() and sock.recv(chunk):
+                time.sleep(delay)
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+def fast_requests(port, path, cookie, duration, timeout):
+    latencies = []
+    failures = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', headers={'Cookie': cookie})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except (urllib.error.URLError, OSError):
+            failures += 1
+    return latencies, failures
+
+def run_mode(name, port, args, cookie):
+    stop = threading.Event()
+    slow = [
+        threading.Thread(target=slow_download, args=(port, '/images/1', args.chunk, args.delay, stop), daemon=True)
+        for _ in range(args.slow_clients)
+    ]
+    for thread in slow:
+        thread.start()
+    # Даём медленным загрузкам занять обработчики
+    time.sleep(1)
+    latencies, failures = fast_requests(port, '/api/v1/books/1', cookie, args.duration, args.timeout)
+    stop.set()
+    if latencies:
+        print(f'{name:<6} быстрых запросов {len(latencies):>5}  p50 {percentile(latencies, 0.5):>9.2f} мс  '
+              f'p90 {percentile(latencies, 0.9):>9.2f} мс  max {max(latencies):>9.2f} мс  таймаутов {failures}')
+    else:
+        print(f'{name:<6} ни один быстрый запрос не завершился за {args.timeout} с, таймаутов {failures}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4, help='Потоков у синхронного сервера.')
+    parser.add_argument('--slow-clients', type=int, default=16)
+    parser.add_argument('--cover-kb', type=int, default=8192, help='Размер обложки, которую качают медленные клиенты.')
+    parser.add_argument('--chunk', type=int, default=4096, help='Байт за одно чтение медленного клиента.')
+    parser.add_argument('--delay', type=float, default=0.01, help='Пауза между чтениями, с.')
+    parser.add_argument('--duration', type=float, default=5.0, help='Длительность замера для каждого режима, с.')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--sync-port', type=int, default=8101)
+    parser.add_argument('--async-port', type=int, default=8102)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='webexam-concurrency-')
+    configure_environment(workdir)
+    from app import create_app
+    from benchmarks.seed import seed, PASSWORD
+
+    app = create_app()
+    with app.app_context():
+        seed(books=200, reviews_per_book=2, users=5)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'bench.png'), 'r+b') as f:
+        f.seek(args.cover_kb * 1024 - 1)
+        f.write(b'\0')
+    client = app.test_client()
+    client.post('/auth/login', data={'login': 'user1', 'password': PASSWORD})
+    cookie = f'{app.config["SESSION_COOKIE_NAME"]}={client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value}'
+
+    context = multiprocessing.get_context('spawn')
+    servers = {
+        'sync': (context.Process(target=serve_sync, args=(args.sync_port, args.threads), daemon=True), args.sync_port),
+        'async': (context.Process(target=serve_async, args=(args.async_port,), daemon=True), args.async_port),
+    }
+    try:
+        for name, (process, port) in servers.items():
+            process.start()
+            wait_for_port(port)
+            run_mode(name, port, args, cookie)
+    finally:
+        for process, _ in servers.values():
+            process.terminate()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Нагрузочный прогон основных страниц на синтетической базе SQLite.
+
+Запуск из каталога app:
+
+    python -m benchmarks.run --books 2000 --reviews-per-book 20
+    python -m benchmarks.run --update-baseline
+
+Для каждого маршрута печатаются перцентили задержки и число SQL-запросов.
+В baseline хранятся число запросов и p90 в единицах калибровочного цикла,
+замеренного в том же прогоне, - так baseline не зависит от машины. Если
+маршрут выполняет больше запросов или стал относительно медленнее (с учётом
+допуска), процесс завершается с кодом 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+CALIBRATION_LOOP = 200000
+
+def configure_environment(workdir):
+    # Настройки должны быть заданы до create_app: движок БД создаётся в фабрике
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['FLASK_UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['FLASK_THUMBNAILS_ENABLED'] = 'false'
+    # Прогон многократно входит с одного адреса - ограничение попыток входа отключено
+    os.environ['FLASK_LOGIN_THROTTLE_BACKEND'] = '""'
+    # Иначе index измеряет только попадание в кэш страниц и не заметит N+1 в рендеринге каталога
+    os.environ['FLASK_PAGE_CACHE_BACKEND'] = '""'
+
+def calibrate(runs=7):
+    # Время фиксированного цикла на чистом Python - единица, в которой p90 сравнивается с baseline
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        sum(i * i for i in range(CALIBRATION_LOOP))
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+class Scenario:
+    def __init__(self, name, request, user=None):
+        self.name = name
+        self.request = request
+        self.user = user
+
+def scenarios(books):
+    middle = max(books // 2, 1)
+    return [
+        Scenario('index', lambda client: client.get('/')),
+        Scenario('index_auth', lambda client: client.get('/'), user='user3'),
+        Scenario('show_book', lambda client: client.get(f'/book/show_book/{middle}'), user='user3'),
+        Scenario('current_collection', lambda client: client.get('/collection/current_collection/7'), user='user3'),
+        Scenario('make_review', lambda client: client.post(
+            f'/review/make_review/{middle}', data={'review': '5', 'text': 'Отличная книга'}), user='user3'),
+        Scenario('login', lambda client: client.post(
+            '/auth/login', data={'login': 'user3', 'password': 'bench'})),
+    ]
+
+def measure(app, engine, scenario, iterations, warmup):
+    from tools import QueryCounter
+    from benchmarks.seed import PASSWORD
+
+    client = app.test_client()
+    if scenario.user:
+        client.post('/auth/login', data={'login': scenario.user, 'password': PASSWORD})
+    for _ in range(warmup):
+        scenario.request(client)
+
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        with QueryCounter(engine) as counter:
+            started = time.perf_counter()
+            response = scenario.request(client)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.name}: HTTP {response.status_code}')
+        queries.append(counter.count)
+    return {
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p90_ms': round(percentile(latencies, 0.9), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries': max(queries),
+    }
+
+def baseline_entry(result, unit_ms):
+    return {'queries': result['queries'], 'p90_units': round(result['p90_ms'] / unit_ms, 3)}
+
+def compare(results, baseline, unit_ms, tolerance, slack_ms):
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result['queries'] > expected['queries']:
+            failures.append(f'{name}: {result["queries"]} SQL-запросов при baseline {expected["queries"]}')
+        # Для быстрых маршрутов относительный допуск меньше шума измерений - добавляем абсолютный
+        units = result['p90_ms'] / unit_ms
+        limit = max(expected['p90_units'] * (1 + tolerance), expected['p90_units'] + slack_ms / unit_ms)
+        if units > limit:
+            failures.append(f'{name}: p90 {units:.2f} ед. калибровки при допустимых {limit:.2f}')
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--genres', type=int, default=20)
+    parser.add_argument('--reviews-per-book', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--collections-per-user', type=int, default=3)
+    parser.add_argument('--books-per-collection', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Допустимое замедление p90 относительно baseline (доля).')
+    parser.add_argument('--slack-ms', type=float, default=5.0,
+                        help='Минимальный абсолютный допуск p90 в миллисекундах.')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--routes', nargs='*', help='Прогнать только указанные маршруты.')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='webexam-bench-')
+    configure_environment(workdir)
+    from app import create_app
+    from models import db
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        seed(books=args.books, genres=args.genres, reviews_per_book=args.reviews_per_book, users=args.users,
+             collections_per_user=args.collections_per_user, books_per_collection=args.books_per_collection)
+        print(f'База заполнена за {time.perf_counter() - started:.1f} с ({workdir})')
+        engine = db.engine
+
+    unit_ms = calibrate()
+    print(f'Калибровочный цикл: {unit_ms:.2f} мс')
+    results = {}
+    # Запросы выполняются вне общего контекста приложения, как в настоящем сервере
+    for scenario in scenarios(args.books):
+        if args.routes and scenario.name not in args.routes:
+            continue
+        results[scenario.name] = measure(app, engine, scenario, args.iterations, args.warmup)
+        result = results[scenario.name]
+        print(f'{scenario.name:<20} p50 {result["p50_ms"]:>8} мс  p90 {result["p90_ms"]:>8} мс  '
+              f'p99 {result["p99_ms"]:>8} мс  max {result["max_ms"]:>8} мс  SQL {result["queries"]:>3}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({name: baseline_entry(result, unit_ms) for name, result in results.items()},
+                      f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline сохранён в {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('Baseline не найден, сравнение пропущено (запустите с --update-baseline).')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, unit_ms, args.tolerance, args.slack_ms)
+    for failure in failures:
+        print(f'РЕГРЕССИЯ: {failure}')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import os
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from models import db, Role, User, Genre, Cover, Book, Review, Collection, book_genre_table, collection_book_table
+from configure import ADMIN_ROLE_ID, MODERATOR_ROLE_ID, USER_ROLE_ID
+from commands import recompute_rating_aggregates
+from facets import rebuild_facet_counts
+from search_index import get_search_backend
+
+PASSWORD = 'bench'
+COVER_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024
+
+def chunks(rows, size=5000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def insert_many(table, rows):
+    for chunk in chunks(rows):
+        db.session.execute(table.insert(), chunk)
+
+def seed(books=1000, genres=20, reviews_per_book=10, users=50, collections_per_user=3, books_per_collection=20, seed=42):
+    # Синтетический каталог заданного объёма; вставки идут пачками через Core
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    insert_many(Role.__table__, [
+        {'id': ADMIN_ROLE_ID, 'name': 'Администратор', 'description': 'admin'},
+        {'id': MODERATOR_ROLE_ID, 'name': 'Модератор', 'description': 'moderator'},
+        {'id': USER_ROLE_ID, 'name': 'Пользователь', 'description': 'user'},
+    ])
+    # Хэш считается один раз: дорогой KDF не должен доминировать во времени заполнения
+    password_hash = generate_password_hash(PASSWORD)
+    roles = [ADMIN_ROLE_ID, MODERATOR_ROLE_ID] + [USER_ROLE_ID] * max(users - 2, 0)
+    insert_many(User.__table__, [
+        {'id': i + 1, 'username': f'user{i + 1}', 'password_hash': password_hash,
+         'last_name': 'Фамилия', 'first_name': f'Имя{i + 1}', 'middle_name': None, 'role_id': role_id}
+        for i, role_id in enumerate(roles[:users])
+    ])
+    insert_many(Genre.__table__, [{'id': i + 1, 'name': f'Жанр {i + 1}'} for i in range(genres)])
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    with open(os.path.join(upload_folder, 'bench.png'), 'wb') as f:
+        f.write(COVER_BYTES)
+    insert_many(Cover.__table__, [{'id': 1, 'filename': 'cover.png', 'mime_type': 'image/png', 'md5_hash': 'bench'}])
+
+    insert_many(Book.__table__, [
+        {'id': i + 1, 'title': f'Книга {i + 1}', 'description': f'<p>Описание книги {i + 1}</p>',
+         'year': rng.randint(1900, 2024), 'publisher': 'Издательство', 'author': f'Автор {i % 500}',
+         'pages': rng.randint(50, 1000), 'cover_id': 1}
+        for i in range(books)
+    ])
+    insert_many(book_genre_table, [
+        {'book_id': book_id, 'genre_id': genre_id}
+        for book_id in range(1, books + 1)
+        for genre_id in rng.sample(range(1, genres + 1), k=min(3, genres))
+    ])
+
+    start = datetime.utcnow() - timedelta(days=365)
+    insert_many(Review.__table__, [
+        {'book_id': book_id, 'user_id': rng.randint(1, users), 'rating': rng.randint(0, 5),
+         'text': '<p>Рецензия</p>', 'timestamp': start + timedelta(minutes=rng.randint(0, 525600))}
+        for book_id in range(1, books + 1)
+        for _ in range(reviews_per_book)
+    ])
+
+    collection_rows = []
+    member_rows = []
+    for user_id in range(1, users + 1):
+        for _ in range(collections_per_user):
+            collection_id = len(collection_rows) + 1
+            collection_rows.append({'id': collection_id, 'name': f'Подборка {collection_id}', 'user_id': user_id})
+            member_rows.extend(
+                {'collection_id': collection_id, 'book_id': book_id}
+                for book_id in rng.sample(range(1, books + 1), k=min(books_per_collection, books))
+            )
+    insert_many(Collection.__table__, collection_rows)
+    insert_many(collection_book_table, member_rows)
+    db.session.commit()
+
+    # Производные данные пересчитываются теми же командами, что и в эксплуатации
+    recompute_rating_aggregates()
+    rebuild_facet_counts()
+    backend = get_search_backend()
+    # create_all не знает о таблице индекса - её создаёт миграция
+    backend.ensure_schema()
+    backend.clear()
+    for chunk in chunks(db.session.execute(db.select(Book)).scalars().all(), 1000):
+        backend.index_books(chunk)
+    db.session.commit()
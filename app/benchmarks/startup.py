@@ -0,0 +1,130 @@
+"""Время запуска: холодный старт процесса и загрузка воркера после fork.
+
+Запуск из каталога app:
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --json startup.json
+
+Холодный старт замеряется в новом интерпретаторе: импорт модулей, create_app
+и первый запрос к главной странице. Загрузка воркера - время от fork
+предзагруженного мастера (как gunicorn --preload) до ответа на первый запрос,
+отдельно для мастера без прогрева и после startup.warm_up.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import configure_environment, percentile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLD_PHASES = ('interpreter', 'import', 'create_app', 'first_request', 'total')
+
+def probe():
+    # Выполняется в отдельном процессе; время до main - запуск интерпретатора и этого модуля
+    started = time.perf_counter()
+    import app as appmodule
+    imported = time.perf_counter()
+    app = appmodule.create_app()
+    created = time.perf_counter()
+    response = app.test_client().get('/')
+    finished = time.perf_counter()
+    if response.status_code != 200:
+        raise SystemExit(f'Главная страница ответила {response.status_code}')
+    print(json.dumps({
+        'import': (imported - started) * 1000,
+        'create_app': (created - imported) * 1000,
+        'first_request': (finished - created) * 1000,
+    }))
+
+def cold_start(runs):
+    samples = {phase: [] for phase in COLD_PHASES}
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--probe'],
+                                cwd=APP_DIR, capture_output=True, text=True, check=True)
+        total = (time.perf_counter() - started) * 1000
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        for phase, value in phases.items():
+            samples[phase].append(value)
+        samples['total'].append(total)
+        samples['interpreter'].append(total - sum(phases.values()))
+    return samples
+
+def worker_boot(app, runs):
+    # time.monotonic общий для родителя и потомка, поэтому отсчёт начинается до fork
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = app.test_client().get('/').status_code
+            elapsed = (time.monotonic() - started) * 1000 if status == 200 else -1
+            os.write(write_fd, str(elapsed).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            elapsed = float(pipe.read())
+        os.waitpid(pid, 0)
+        if elapsed < 0:
+            raise RuntimeError('Воркер не смог ответить на первый запрос')
+        samples.append(elapsed)
+    return samples
+
+def summary(samples):
+    return {
+        'p50_ms': round(percentile(samples, 0.5), 2),
+        'p90_ms': round(percentile(samples, 0.9), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--books', type=int, default=500)
+    parser.add_argument('--json', help='Сохранить результаты в файл для сравнения между версиями.')
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        probe()
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='webexam-startup-')
+    configure_environment(workdir)
+    from app import create_app
+    from benchmarks.seed import seed
+    from startup import dispose_engines, warm_up
+
+    seeded = create_app()
+    with seeded.app_context():
+        seed(books=args.books, reviews_per_book=2, users=5)
+    dispose_engines(seeded)
+
+    results = {}
+    for phase, samples in cold_start(args.runs).items():
+        results[f'cold_{phase}'] = summary(samples)
+
+    if hasattr(os, 'fork'):
+        app = create_app()
+        results['worker_boot'] = summary(worker_boot(app, args.runs))
+        warm_up(app)
+        results['worker_boot_warm'] = summary(worker_boot(app, args.runs))
+    else:
+        print('os.fork недоступен - загрузка воркера не замеряется.')
+
+    for name, result in results.items():
+        print(f'{name:<20} p50 {result["p50_ms"]:>9} мс  p90 {result["p90_ms"]:>9} мс  max {result["max_ms"]:>9} мс')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,37 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
-from models import db, Book, Genre, Cover, Review
+from models import db, Book, Genre, Review
 from tools import ImageSaver
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from markdown2 import markdown
+from sqlalchemy import and_
+from sqlalchemy.orm import selectinload, joinedload
 from auth import checkRole
-import bleach
-import os
-from configure import UPLOAD_FOLDER
+from rendering import render_markdown
+from search_index import get_search_backend
+from facets import book_facets, update_facet_counts
+from similar import mark_books_changed, similar_books
+from leaderboards import update_ranking_genres, remove_book_rankings
+from reference import genre_choices
+from collection import touch_book_collections
 from markupsafe import Markup
+from pagination import keyset_paginate
 
 bp = Blueprint('book', __name__, url_prefix='/book')
 
-ALLOWED_TAGS = list(bleach.sanitizer.ALLOWED_TAGS) + ['p', 'strong', 'em', 'ul', 'ol', 'li', 'a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'br', 'blockquote', 'code', 'pre']
-ALLOWED_ATTRIBUTES = {
-    'a': ['href', 'title', 'target'],
-    'img': ['src', 'alt', 'title']
-}
+def valid_year(year):
+    # Год нужен фасетам как число: проверяем до того, как строка из формы попадёт в сессию
+    try:
+        int(year)
+    except (TypeError, ValueError):
+        flash('Год издания должен быть целым числом.', 'danger')
+        return False
+    return True
 
 @bp.route('/create_book', methods=['GET', 'POST'])
 @login_required
 @checkRole('create_book')
 def create_book():
-    genres = db.session.execute(db.select(Genre)).scalars()
+    genres = genre_choices()
     book = Book()
     if request.method == "POST":
         title = request.form.get('name')
@@ -34,7 +43,7 @@ def create_book():
         file = request.files.get('book_cover')
         genre_ids = request.form.getlist('genres')
 
-        description_html = bleach.clean(markdown(description_md), tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+        description_html = render_markdown(description_md)
 
         book = Book(
             title=title,
@@ -44,6 +53,8 @@ def create_book():
             author=author,
             pages=pages
         )
+        if not valid_year(year):
+            return render_template('books/create_book.html', genres=genres, current_user=current_user, book=book)
 
         book.genres = db.session.query(Genre).filter(Genre.id.in_(genre_ids)).all()
 
@@ -55,11 +66,19 @@ def create_book():
                 raise ValueError("Обложка книги обязательна")
             
             db.session.add(book)
+            db.session.flush()
+            get_search_backend().index_book(book)
+            update_facet_counts(set(), book_facets(book))
+            mark_books_changed([book.id])
             db.session.commit()
             
             flash(f'Книга {book.title} была успешно добавлена!', 'success')
             return redirect(url_for('index'))
-        
+
+        except ValueError as err:
+            flash(str(err), 'danger')
+            db.session.rollback()
+
         except IntegrityError as err:
             flash(f'Возникла ошибка при записи данных в БД. Проверьте корректность введённых данных. ({err})', 'danger')
             db.session.rollback()
@@ -71,7 +90,7 @@ def create_book():
 @checkRole('edit_book')
 def edit_book(book_id):
     book = db.session.query(Book).filter_by(id=book_id).first()
-    genres = db.session.execute(db.select(Genre)).scalars()
+    genres = genre_choices()
     
     if request.method == "POST":
         title = request.form.get('name')
@@ -81,9 +100,13 @@ def edit_book(book_id):
         author = request.form.get('author')
         pages = request.form.get('pages')
         genre_ids = request.form.getlist('genres')
+        if not valid_year(year):
+            return render_template('books/edit_book.html', book=book, genres=genres, current_user=current_user)
+        facets_before = book_facets(book)
+        genres_before = {genre.id for genre in book.genres}
         
         book.title = title
-        book.description = bleach.clean(markdown(description_md), tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+        book.description = render_markdown(description_md)
         book.publisher = publisher
         book.author = author
         book.pages = pages
@@ -93,6 +116,12 @@ def edit_book(book_id):
 
         try:
             db.session.add(book)
+            get_search_backend().index_book(book)
+            update_facet_counts(facets_before, book_facets(book))
+            genres_after = {genre.id for genre in book.genres}
+            if genres_after != genres_before:
+                mark_books_changed([book.id])
+                update_ranking_genres(book.id, genres_before, genres_after)
             db.session.commit()
             flash(f'Книга {book.title} была успешно обновлена!', 'success')
             return redirect(url_for('index'))
@@ -113,21 +142,15 @@ def delete_book(book_id):
         return redirect(url_for('index'))
 
     try:
-        cover_id = book.cover_id
+        update_facet_counts(book_facets(book), set())
+        # До delete: следующий execute сбросит удаление в БД вместе со строками collection_book
+        touch_book_collections(book_id)
         db.session.delete(book)
+        get_search_backend().remove_book(book_id)
+        mark_books_changed([book_id])
+        remove_book_rankings(book_id)
         db.session.commit()
-
-        # Проверка на наличие других книг с этой обложкой
-        cover = db.session.query(Cover).filter_by(id=cover_id).first()
-        if cover:
-            related_books = db.session.query(Book).filter_by(cover_id=cover.id).count()
-            if related_books == 0:
-                file_path = os.path.join(UPLOAD_FOLDER, cover.storage_filename)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                db.session.delete(cover)
-                db.session.commit()
-
+        # Обложка без книг и её файлы удаляются сборщиком: flask covers gc
         flash(f'Книга "{book.title}" была успешно удалена!', 'success')
 
     except SQLAlchemyError as err:
@@ -139,10 +162,24 @@ def delete_book(book_id):
 @bp.route('/show_book/<int:book_id>', methods=["GET"])
 @login_required
 def show_book(book_id):
-    book = db.session.query(Book).filter_by(id=book_id).first_or_404()
-    cover = db.session.query(Cover).filter_by(id=book.cover_id).first()
-    reviews = db.session.query(Review).filter_by(book_id=book_id).all()
-    user_review = db.session.query(Review).filter_by(book_id=book_id, user_id=current_user.id).first()
+    # Книга, обложка и рецензия текущего пользователя одним запросом
+    row = db.session.execute(
+        db.select(Book, Review)
+        .outerjoin(Review, and_(Review.book_id == Book.id, Review.user_id == current_user.id))
+        .options(joinedload(Book.cover), selectinload(Book.genres))
+        .where(Book.id == book_id)
+    ).first()
+    if row is None:
+        abort(404)
+    book, user_review = row
+    cover = book.cover
+    # Рецензии постранично от новых к старым, авторы подгружаются одним запросом на страницу
+    reviews = keyset_paginate(
+        db.select(Review).options(selectinload(Review.user)).where(Review.book_id == book_id),
+        [Review.timestamp, Review.id],
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config.get('REVIEWS_PER_PAGE', 20),
+    )
 
     books_with_genres_cover = {
         'id': book.id,
@@ -153,7 +190,8 @@ def show_book(book_id):
         'description': Markup(book.description),
         'year': book.year,
         'genres': [genre.name for genre in book.genres],
-        'cover': cover.url if cover else None,
+        'cover': cover.sized_url('medium') if cover else None,
     }
+    similar = similar_books(book.id, current_app.config.get('SIMILAR_BOOKS_LIMIT', 5))
 
-    return render_template('books/show_book.html', book=books_with_genres_cover, current_user=current_user, user_review=user_review, reviews=reviews)
+    return render_template('books/show_book.html', book=books_with_genres_cover, current_user=current_user, user_review=user_review, reviews=reviews.items, reviews_pog=reviews, similar=similar)
@@ -19,4 +19,7 @@ class CheckRights:
     def add_collection(self):
         return current_user.is_admin() or current_user.is_user()
 
+    def export(self):
+        return current_user.is_admin()
+
 
@@ -1,21 +1,86 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
-from models import db, Book, Genre, Cover, Review, Collection
-from tools import ImageSaver
+from models import db, Book, Genre, Cover, Review, Collection, collection_book_table
+from tools import ImageSaver, insert_ignore
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy import select, delete, update, func, literal
+from sqlalchemy.orm import selectinload
 from markdown2 import markdown
 from auth import checkRole
 import bleach
 import os
 from configure import UPLOAD_FOLDER
 from markupsafe import Markup
+from pagination import keyset_paginate
+from similar import mark_books_changed
 
 bp = Blueprint('collection', __name__, url_prefix='/collection')
 
+# Ограничение на число книг в одном массовом запросе
+MAX_BULK_BOOKS = 500
+
+def touch_collection(collection_id):
+    # Состав меняется мимо ORM, поэтому версию (ETag в API) поднимаем явно
+    db.session.execute(
+        update(Collection).where(Collection.id == collection_id).values(version=Collection.version + 1)
+    )
+
+def touch_book_collections(book_id):
+    # Удаление книги убирает её строки из collection_book: версии этих подборок тоже должны измениться
+    db.session.execute(
+        update(Collection)
+        .where(Collection.id.in_(
+            select(collection_book_table.c.collection_id).where(collection_book_table.c.book_id == book_id)
+        ))
+        .values(version=Collection.version + 1)
+    )
+
+def add_books(collection_id, book_ids):
+    # Вставляются только существующие книги, повторное добавление ничего не меняет
+    statement = insert_ignore(collection_book_table).from_select(
+        ['collection_id', 'book_id'],
+        select(literal(collection_id), Book.id).where(Book.id.in_(book_ids)),
+    )
+    added = db.session.execute(statement).rowcount
+    if added:
+        touch_collection(collection_id)
+        mark_books_changed(book_ids)
+    return added
+
+def remove_books(collection_id, book_ids):
+    removed = db.session.execute(
+        delete(collection_book_table).where(
+            collection_book_table.c.collection_id == collection_id,
+            collection_book_table.c.book_id.in_(book_ids),
+        )
+    ).rowcount
+    if removed:
+        touch_collection(collection_id)
+        mark_books_changed(book_ids)
+    return removed
+
+def own_collection_id(collection_id):
+    return db.session.execute(
+        select(Collection.id).where(Collection.id == collection_id, Collection.user_id == current_user.id)
+    ).scalar()
+
+def requested_book_ids():
+    book_ids = sorted(set(request.form.getlist('book_id', type=int)))
+    if len(book_ids) > MAX_BULK_BOOKS:
+        return None
+    return book_ids
+
 @bp.route('/show_collection/<int:user_id>', methods=["GET"])
 @login_required
 def show_collection(user_id):
-    collections = db.session.query(Collection).filter_by(user_id=user_id).all()
+    # Число книг считается в БД, состав подборок не загружается
+    collections = db.session.execute(
+        select(Collection, func.count(collection_book_table.c.book_id))
+        .outerjoin(collection_book_table, collection_book_table.c.collection_id == Collection.id)
+        .where(Collection.user_id == user_id)
+        .group_by(Collection.id)
+        .order_by(Collection.id)
+    ).all()
     return render_template('collections/user_collections.html', collections=collections)
 
 @bp.route('/add_collection', methods=['POST'])
@@ -39,28 +104,63 @@ def current_collection(collection_id):
     if not collection:
         flash('Подборка не найдена.', 'danger')
         return redirect(url_for('collection.show_collection', user_id=current_user.id))
-    books = collection.books
-    return render_template('collections/current_collection.html', collection=collection, books=books)
+    # Постранично по первичному ключу collection_book (collection_id, book_id)
+    books = keyset_paginate(
+        select(Book)
+        .join(collection_book_table, collection_book_table.c.book_id == Book.id)
+        .where(collection_book_table.c.collection_id == collection.id)
+        .options(selectinload(Book.genres)),
+        [Book.id],
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config.get('COLLECTION_BOOKS_PER_PAGE', 20),
+    )
+    return render_template('collections/current_collection.html', collection=collection, books=books.items, books_pog=books)
 
 
 @bp.route('/add_to_collection', methods=['POST'])
 @login_required
 def add_to_collection():
-    collection_id = request.form.get('collection_id')
-    book_id = request.form.get('book_id')
-
-    collection = db.session.query(Collection).filter_by(id=collection_id, user_id=current_user.id).first()
-    book = db.session.query(Book).filter_by(id=book_id).first()
+    collection_id = own_collection_id(request.form.get('collection_id', type=int))
+    book_ids = requested_book_ids()
 
-    if not collection or not book:
+    if not collection_id or not book_ids:
         flash('Подборка или книга не найдены.', 'danger')
         return redirect(url_for('index'))
 
-    collection.books.append(book)
+    add_books(collection_id, book_ids)
     db.session.commit()
 
     flash('Книга успешно добавлена в подборку!', 'success')
     return redirect(url_for('index'))
 
+@bp.route('/<int:collection_id>/add_books', methods=['POST'])
+@login_required
+def add_books_to_collection(collection_id):
+    if not own_collection_id(collection_id):
+        flash('Подборка не найдена.', 'danger')
+        return redirect(url_for('collection.show_collection', user_id=current_user.id))
+    book_ids = requested_book_ids()
+    if book_ids is None:
+        flash(f'За один раз можно добавить не более {MAX_BULK_BOOKS} книг.', 'danger')
+        return redirect(url_for('collection.current_collection', collection_id=collection_id))
 
+    added = add_books(collection_id, book_ids) if book_ids else 0
+    db.session.commit()
+    flash(f'Добавлено книг: {added}', 'success')
+    return redirect(url_for('collection.current_collection', collection_id=collection_id))
 
+@bp.route('/<int:collection_id>/remove_books', methods=['POST'])
+@login_required
+def remove_books_from_collection(collection_id):
+    if not own_collection_id(collection_id):
+        flash('Подборка не найдена.', 'danger')
+        return redirect(url_for('collection.show_collection', user_id=current_user.id))
+    book_ids = requested_book_ids()
+    if book_ids is None:
+        flash(f'За один раз можно убрать не более {MAX_BULK_BOOKS} книг.', 'danger')
+        return redirect(url_for('collection.current_collection', collection_id=collection_id))
+
+    removed = remove_books(collection_id, book_ids) if book_ids else 0
+    db.session.commit()
+    flash(f'Убрано книг из подборки: {removed}', 'success')
+    return redirect(url_for('collection.current_collection', collection_id=collection_id))
@@ -0,0 +1,303 @@
+import os
+import sqlite3
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update, func, cast, case, Float
+from models import db, Book, Review, Cover
+from rendering import renderer
+from thumbnails import COVER_SIZES, derivative_filename, schedule_derivatives
+from search_index import get_search_backend
+from facets import rebuild_facet_counts
+from importer import CatalogImporter, ImportRecordError
+from exporter import EXPORTS, FORMATS, export_lines, review_watermark
+from page_cache import CATALOG, bump_generation
+from cover_gc import DEFAULT_GRACE_PERIOD, collect_garbage
+from db_routing import REPLICA_BIND
+from throttle import DatabaseBuckets
+from similar import rebuild_similarities, refresh_similarities
+from leaderboards import rebuild_leaderboards, refresh_leaderboards
+
+ratings_cli = AppGroup('ratings', help='Обслуживание агрегатов рейтинга книг.')
+content_cli = AppGroup('content', help='Обслуживание HTML-описаний книг и рецензий.')
+covers_cli = AppGroup('covers', help='Обслуживание файлов обложек.')
+search_cli = AppGroup('search', help='Обслуживание полнотекстового индекса книг.')
+facets_cli = AppGroup('facets', help='Обслуживание счётчиков фасетов каталога.')
+books_cli = AppGroup('books', help='Массовые операции с каталогом книг.')
+replica_cli = AppGroup('replica', help='Обслуживание реплики для чтения.')
+throttle_cli = AppGroup('throttle', help='Обслуживание ограничений попыток входа.')
+similar_cli = AppGroup('similar', help='Обслуживание индекса похожих книг.')
+leaderboards_cli = AppGroup('leaderboards', help='Обслуживание рейтингов лучших и обсуждаемых книг.')
+
+def init_commands(app):
+    app.cli.add_command(ratings_cli)
+    app.cli.add_command(content_cli)
+    app.cli.add_command(covers_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(facets_cli)
+    app.cli.add_command(books_cli)
+    app.cli.add_command(replica_cli)
+    app.cli.add_command(throttle_cli)
+    app.cli.add_command(similar_cli)
+    app.cli.add_command(leaderboards_cli)
+
+def actual_rating_stats():
+    # Фактические значения по таблице reviews, сгруппированные по книге
+    return (
+        select(
+            Review.book_id.label('book_id'),
+            func.sum(Review.rating).label('rating_sum'),
+            func.count(Review.id).label('reviews_count'),
+        )
+        .group_by(Review.book_id)
+        .subquery()
+    )
+
+def find_rating_mismatches():
+    stats = actual_rating_stats()
+    actual_sum = func.coalesce(stats.c.rating_sum, 0)
+    actual_count = func.coalesce(stats.c.reviews_count, 0)
+    query = (
+        select(Book.id, Book.rating_sum, Book.reviews_count, actual_sum, actual_count)
+        .outerjoin(stats, stats.c.book_id == Book.id)
+        .where((Book.rating_sum != actual_sum) | (Book.reviews_count != actual_count))
+    )
+    return db.session.execute(query).all()
+
+def recompute_rating_aggregates():
+    rating_sum = (
+        select(func.coalesce(func.sum(Review.rating), 0))
+        .where(Review.book_id == Book.id)
+        .scalar_subquery()
+    )
+    reviews_count = (
+        select(func.count(Review.id))
+        .where(Review.book_id == Book.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(Book).values(
+            rating_sum=rating_sum,
+            reviews_count=reviews_count,
+            average_rating=case(
+                (reviews_count > 0, func.round(cast(rating_sum, Float) / reviews_count, 2)),
+                else_=None,
+            ),
+        )
+    )
+    # Массовый UPDATE идёт мимо сессии, поэтому кэш каталога сбрасывается явно
+    bump_generation(db.session.connection(), CATALOG)
+    db.session.commit()
+    return result.rowcount
+
+@ratings_cli.command('recompute')
+def recompute_ratings():
+    """Пересчитать агрегаты рейтинга всех книг одним запросом."""
+    click.echo(f'Пересчитано книг: {recompute_rating_aggregates()}')
+    # Bayesian-оценки считаются от агрегатов
+    refresh_leaderboards()
+
+@ratings_cli.command('verify')
+def verify_ratings():
+    """Сверить сохранённые агрегаты с таблицей reviews."""
+    mismatches = find_rating_mismatches()
+    for book_id, stored_sum, stored_count, actual_sum, actual_count in mismatches:
+        click.echo(f'Книга {book_id}: сумма {stored_sum} != {actual_sum}, '
+                   f'рецензий {stored_count} != {actual_count}')
+    if mismatches:
+        raise click.ClickException(f'Расхождений: {len(mismatches)}. Выполните "flask ratings recompute".')
+    click.echo('Агрегаты рейтинга согласованы.')
+
+def resanitize_column(column, batch_size):
+    model = column.class_
+    changed = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, column).where(model.id > last_id).order_by(model.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        cleaned = renderer.sanitize_many(html for _, html in rows)
+        updates = [
+            {'id': row_id, column.key: new_html}
+            for (row_id, old_html), new_html in zip(rows, cleaned)
+            if new_html != old_html
+        ]
+        if updates:
+            db.session.execute(update(model), updates)
+            # Массовый UPDATE идёт мимо сессии, поэтому кэш каталога сбрасывается явно
+            bump_generation(db.session.connection(), CATALOG)
+            db.session.commit()
+            changed += len(updates)
+    return changed
+
+@content_cli.command('resanitize')
+@click.option('--batch-size', default=500, show_default=True)
+def resanitize_content(batch_size):
+    """Пропустить сохранённые описания и рецензии через текущий allow-list."""
+    renderer.clear()
+    books = resanitize_column(Book.description, batch_size)
+    reviews = resanitize_column(Review.text, batch_size)
+    click.echo(f'Обновлено описаний: {books}, рецензий: {reviews}')
+
+@covers_cli.command('derivatives')
+def build_derivatives():
+    """Создать недостающие миниатюры для всех обложек."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    futures = []
+    for cover in db.session.execute(select(Cover)).scalars():
+        storage_filename = cover.storage_filename
+        missing = [
+            size for size in COVER_SIZES
+            if not os.path.exists(os.path.join(upload_folder, derivative_filename(storage_filename, size)))
+        ]
+        if missing and os.path.exists(os.path.join(upload_folder, storage_filename)):
+            future = schedule_derivatives(storage_filename)
+            if future is None:
+                raise click.ClickException('Миниатюры недоступны: не установлен Pillow или THUMBNAILS_ENABLED = False.')
+            futures.append(future)
+    failed = sum(1 for future in futures if future.exception() is not None)
+    click.echo(f'Обработано обложек: {len(futures)}, с ошибками: {failed}')
+
+@covers_cli.command('gc')
+@click.option('--grace-period', default=DEFAULT_GRACE_PERIOD, show_default=True, help='Возраст в секундах, после которого незавершённая загрузка считается брошенной.')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Только посчитать, ничего не удаляя.')
+def collect_covers(grace_period, batch_size, dry_run):
+    """Удалить обложки без книг и файлы без строк в covers (запускать по расписанию)."""
+    rows, files = collect_garbage(grace_period, batch_size, dry_run)
+    prefix = 'Будет удалено' if dry_run else 'Удалено'
+    click.echo(f'{prefix} записей обложек: {rows}, файлов: {files}')
+
+@search_cli.command('rebuild')
+@click.option('--batch-size', default=500, show_default=True)
+def rebuild_search_index(batch_size):
+    """Перестроить поисковый индекс по всем книгам."""
+    backend = get_search_backend()
+    backend.ensure_schema()
+    backend.clear()
+    indexed = 0
+    last_id = 0
+    while True:
+        books = db.session.execute(
+            select(Book).where(Book.id > last_id).order_by(Book.id).limit(batch_size)
+        ).scalars().all()
+        if not books:
+            break
+        last_id = books[-1].id
+        backend.index_books(books)
+        db.session.commit()
+        indexed += len(books)
+        click.echo(f'Проиндексировано книг: {indexed}')
+    db.session.commit()
+    click.echo(f'Индекс перестроен, всего книг: {indexed}')
+
+@facets_cli.command('rebuild')
+def rebuild_facets():
+    """Пересчитать счётчики книг по жанрам и десятилетиям."""
+    rebuild_facet_counts()
+    click.echo('Счётчики фасетов пересчитаны.')
+
+@books_cli.command('import')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--covers', 'covers_dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Каталог с файлами обложек (поле cover - имя файла в нём).')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(['auto', 'csv', 'jsonl']), default='auto', show_default=True)
+@click.option('--skip-invalid', is_flag=True, help='Пропускать некорректные записи вместо остановки.')
+@click.option('--restart', is_flag=True, help='Начать заново, игнорируя сохранённую позицию.')
+def import_books(source, covers_dir, batch_size, fmt, skip_invalid, restart):
+    """Загрузить книги из CSV/JSONL пакетами; повторный запуск продолжает с места остановки."""
+    importer = CatalogImporter(source, covers_dir, batch_size=batch_size, fmt=fmt, skip_invalid=skip_invalid)
+    if restart:
+        importer.reset()
+
+    def progress(position, imported, rate):
+        click.echo(f'Обработано записей: {position}, загружено книг: {imported}, {rate:.0f} книг/с')
+
+    try:
+        position = importer.run(progress)
+    except ImportRecordError as err:
+        raise click.ClickException(f'{err}. Загружено до ошибки: {importer.imported}; '
+                                   'повторный запуск продолжит с последнего пакета.')
+    click.echo(f'Готово: позиция {position}, загружено {importer.imported}, пропущено {importer.skipped}.')
+
+@books_cli.command('export')
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='jsonl', show_default=True)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Файл результата (по умолчанию stdout).')
+@click.option('--after-id', type=int, help='Выгрузить рецензии с id больше этого.')
+@click.option('--watermark-file', type=click.Path(dir_okay=False),
+              help='Файл с id последней выгруженной рецензии: читается как --after-id и обновляется после выгрузки.')
+def export_table(kind, fmt, output, after_id, watermark_file):
+    """Потоково выгрузить books, reviews или collections в CSV/JSONL."""
+    if watermark_file and after_id is None and os.path.exists(watermark_file):
+        with open(watermark_file, encoding='utf-8') as f:
+            try:
+                after_id = int(f.read().strip())
+            except ValueError:
+                raise click.ClickException(f'В {watermark_file} ожидается id рецензии.')
+    until = review_watermark(after_id) if kind == 'reviews' else None
+    for line in export_lines(kind, fmt, after_id, until):
+        output.write(line)
+    if kind == 'reviews' and watermark_file and until is not None:
+        with open(watermark_file, 'w', encoding='utf-8') as f:
+            f.write(str(until))
+        click.echo(f'Отметка выгрузки: {until}', err=True)
+
+@replica_cli.command('sync')
+def sync_replica():
+    """Скопировать primary в реплику (только SQLite, для локальной проверки маршрутизации)."""
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('Реплика не настроена: задайте SQLALCHEMY_REPLICA_URI.')
+    primary, replica = db.engines[None].url, db.engines[REPLICA_BIND].url
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise click.ClickException('Копирование поддерживается только между файлами SQLite; '
+                                   'для MySQL используйте штатную репликацию.')
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    click.echo(f'Реплика {replica.database} обновлена из {primary.database}')
+
+@throttle_cli.command('prune')
+@click.option('--max-idle', default=24 * 60 * 60, show_default=True, help='Удалить вёдра, не использованные столько секунд.')
+def prune_throttle(max_idle):
+    """Удалить давно не использованные строки throttle_buckets (запускать по расписанию)."""
+    click.echo(f'Удалено вёдер: {DatabaseBuckets().prune(max_idle)}')
+
+@similar_cli.command('rebuild')
+@click.option('--batch-size', default=500, show_default=True)
+def rebuild_similar(batch_size):
+    """Полностью пересчитать похожие книги по подборкам и жанрам."""
+    try:
+        books = rebuild_similarities(batch_size)
+    except RuntimeError as err:
+        raise click.ClickException(str(err))
+    click.echo(f'Пересчитано книг: {books}')
+
+@similar_cli.command('refresh')
+@click.option('--batch-size', default=500, show_default=True)
+def refresh_similar(batch_size):
+    """Пересчитать похожие для изменившихся книг из очереди (запускать по расписанию)."""
+    try:
+        refreshed = refresh_similarities(batch_size)
+    except RuntimeError as err:
+        raise click.ClickException(str(err))
+    click.echo(f'Обновлено списков похожих: {refreshed}')
+
+@leaderboards_cli.command('refresh')
+def refresh_boards():
+    """Пересчитать среднюю оценку каталога и Bayesian-оценки (запускать по расписанию)."""
+    prior_mean, removed = refresh_leaderboards()
+    click.echo(f'Средняя оценка каталога: {prior_mean:.2f}, удалено строк: {removed}')
+
+@leaderboards_cli.command('rebuild')
+def rebuild_boards():
+    """Полностью пересобрать рейтинги с новым началом отсчёта трендов."""
+    click.echo(f'Книг в рейтингах: {rebuild_leaderboards()}')
@@ -0,0 +1,117 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete, exists, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Book, Cover
+from covers import forget_cover
+from thumbnails import COVER_SIZES, derivative_filename
+
+# Загрузка, начатая раньше этого срока, считается брошенной
+DEFAULT_GRACE_PERIOD = 60 * 60
+TEMP_PREFIXES = ('.upload-', '.derivative-')
+# <md5><ext> или <md5>.<size><ext>
+STORED_FILE = re.compile(r'^([0-9a-f]{32})(?:\.|$)')
+
+def orphan_cover_rows(cutoff, last_id, batch_size):
+    return db.session.execute(
+        select(Cover.id)
+        .where(
+            Cover.id > last_id,
+            ~exists().where(Book.cover_id == Cover.id),
+            or_(Cover.last_used_at.is_(None), Cover.last_used_at < cutoff),
+        )
+        .order_by(Cover.id)
+        .limit(batch_size)
+    ).scalars().all()
+
+def collect_cover_rows(grace_period=DEFAULT_GRACE_PERIOD, batch_size=500, dry_run=False):
+    # Условия повторяются в DELETE: обложку могли использовать снова между SELECT и удалением
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_period)
+    removed = 0
+    last_id = 0
+    while True:
+        ids = orphan_cover_rows(cutoff, last_id, batch_size)
+        if not ids:
+            break
+        last_id = ids[-1]
+        if dry_run:
+            removed += len(ids)
+            continue
+        try:
+            result = db.session.execute(
+                delete(Cover)
+                .where(
+                    Cover.id.in_(ids),
+                    ~exists().where(Book.cover_id == Cover.id),
+                    or_(Cover.last_used_at.is_(None), Cover.last_used_at < cutoff),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except IntegrityError:
+            # Параллельная транзакция успела сослаться на обложку; пачка будет разобрана при следующем запуске
+            db.session.rollback()
+            continue
+        removed += result.rowcount
+        for cover_id in ids:
+            forget_cover(cover_id)
+    return removed
+
+def stored_filenames(covers):
+    names = set()
+    for cover in covers:
+        names.add(cover.storage_filename)
+        names.update(derivative_filename(cover.storage_filename, size) for size in COVER_SIZES)
+    return names
+
+def sweep_batch(entries, dry_run):
+    hashes = {STORED_FILE.match(entry.name).group(1) for entry in entries}
+    known = stored_filenames(
+        db.session.execute(select(Cover).where(Cover.md5_hash.in_(hashes))).scalars()
+    )
+    removed = 0
+    for entry in entries:
+        if entry.name not in known:
+            if not dry_run:
+                remove_quietly(entry.path)
+            removed += 1
+    return removed
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def sweep_upload_folder(grace_period=DEFAULT_GRACE_PERIOD, batch_size=500, dry_run=False):
+    # Файл появляется в хранилище раньше, чем фиксируется строка covers, поэтому свежие файлы не трогаем
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    cutoff = time.time() - grace_period
+    removed = 0
+    batch = []
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False) or entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.name.startswith(TEMP_PREFIXES):
+                # Остатки прерванных загрузок и генерации миниатюр
+                if not dry_run:
+                    remove_quietly(entry.path)
+                removed += 1
+            elif STORED_FILE.match(entry.name):
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    removed += sweep_batch(batch, dry_run)
+                    batch = []
+    if batch:
+        removed += sweep_batch(batch, dry_run)
+    return removed
+
+def collect_garbage(grace_period=DEFAULT_GRACE_PERIOD, batch_size=500, dry_run=False):
+    # Сначала строки, затем файлы: файлы удалённых строк уходят в том же запуске
+    rows = collect_cover_rows(grace_period, batch_size, dry_run)
+    files = sweep_upload_folder(grace_period, batch_size, dry_run)
+    return rows, files
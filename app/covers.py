@@ -0,0 +1,80 @@
+import os
+from flask import current_app, request, send_from_directory, abort
+from models import db, Cover
+from cache import LRUCache
+from thumbnails import COVER_SIZES, derivative_filename
+
+# Файлы обложек адресуются md5 содержимого, поэтому ответ по одному id никогда не меняется
+COVER_MAX_AGE = 365 * 24 * 60 * 60
+# Оригинал вместо ещё не готовой миниатюры: по этому URL скоро будет другой файл
+COVER_FALLBACK_MAX_AGE = 60
+
+def cover_cache_control(size, derivative):
+    if size in COVER_SIZES and not derivative:
+        return f'public, max-age={COVER_FALLBACK_MAX_AGE}'
+    return f'public, max-age={COVER_MAX_AGE}, immutable'
+
+# id обложки -> (имя файла в хранилище, md5, mime-тип); повторные запросы не обращаются к БД
+cover_files = LRUCache(maxsize=10000)
+
+def cover_file(image_id):
+    info = cover_files.get(image_id)
+    if info is None:
+        cover = db.session.get(Cover, image_id)
+        if cover is None:
+            abort(404)
+        info = (cover.storage_filename, cover.md5_hash, cover.mime_type)
+        cover_files.set(image_id, info)
+    return info
+
+def forget_cover(cover_id):
+    cover_files.delete(cover_id)
+
+def offload_header(config, storage_filename):
+    # Отдачу байтов берёт на себя фронтовой прокси (nginx / Apache mod_xsendfile)
+    offload = config.get('COVER_OFFLOAD')
+    if offload == 'x-accel-redirect':
+        prefix = config.get('COVER_ACCEL_PREFIX', '/protected/covers/')
+        return 'X-Accel-Redirect', prefix + storage_filename
+    if offload == 'x-sendfile':
+        upload_folder = os.path.abspath(config['UPLOAD_FOLDER'])
+        return 'X-Sendfile', os.path.join(upload_folder, storage_filename)
+    return None
+
+def offloaded_response(storage_filename, mime_type):
+    header = offload_header(current_app.config, storage_filename)
+    if header is None:
+        return None
+    response = current_app.response_class(mimetype=mime_type)
+    response.headers[header[0]] = header[1]
+    return response
+
+def existing_derivative(storage_filename, size):
+    if size not in COVER_SIZES:
+        return None
+    filename = derivative_filename(storage_filename, size)
+    if os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], filename)):
+        return filename
+    return None
+
+def send_cover(image_id, size=None):
+    storage_filename, md5_hash, mime_type = cover_file(image_id)
+
+    # Если производная ещё не готова, отдаём оригинал (и его ETag)
+    derivative = existing_derivative(storage_filename, size) if size else None
+    if derivative:
+        storage_filename = derivative
+        md5_hash = f'{md5_hash}.{size}'
+
+    if request.if_none_match.contains(md5_hash):
+        response = current_app.response_class(status=304)
+    else:
+        response = offloaded_response(storage_filename, mime_type)
+        if response is None:
+            response = send_from_directory(
+                current_app.config['UPLOAD_FOLDER'], storage_filename, mimetype=mime_type, etag=md5_hash,
+            )
+
+    response.set_etag(md5_hash)
+    response.headers['Cache-Control'] = cover_cache_control(size, derivative)
+    return response
@@ -0,0 +1,71 @@
+import time
+from flask import request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.elements import TextClause
+
+REPLICA_BIND = 'replica'
+# Флаг в Session.info: текущий запрос может читать с реплики
+USE_REPLICA = 'use_replica'
+# Ключ в cookie-сессии: до этого момента клиент читает с primary, чтобы видеть свои записи
+PRIMARY_UNTIL = '_primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+
+def is_read(clause):
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return getattr(clause, 'is_select', False)
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(USE_REPLICA):
+            if not self._flushing and is_read(clause):
+                return self._db.engines[REPLICA_BIND]
+            # После первой записи весь остаток запроса идёт на primary
+            self.info[USE_REPLICA] = False
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def engine_options(uri, config):
+    options = {
+        # Проверка соединения перед выдачей из пула: переживает рестарт СУБД и обрывы по wait_timeout
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if not uri.startswith('sqlite'):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+    return options
+
+def init_db_routing(app):
+    # Вызывается до db.init_app: настройки пула и bind реплики читаются при создании движков
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_MAX_OVERFLOW', 20)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    )
+    replica_uri = app.config['SQLALCHEMY_REPLICA_URI']
+    if not replica_uri:
+        return
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds[REPLICA_BIND] = {'url': replica_uri, **engine_options(replica_uri, app.config)}
+
+    @app.before_request
+    def route_reads_to_replica():
+        if request.method in SAFE_METHODS and session.get(PRIMARY_UNTIL, 0) < time.time():
+            app.extensions['sqlalchemy'].session.info[USE_REPLICA] = True
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in SAFE_METHODS:
+            session[PRIMARY_UNTIL] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        return response
@@ -0,0 +1,31 @@
+from flask import Blueprint, Response, request, stream_with_context, abort
+from flask_login import login_required
+from auth import checkRole
+from exporter import EXPORTS, FORMATS, export_lines, review_watermark
+
+bp = Blueprint('export', __name__, url_prefix='/export')
+
+MIME_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+@bp.route('/<kind>.<fmt>', methods=['GET'])
+@login_required
+@checkRole('export')
+def export_table(kind, fmt):
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    after_id = request.args.get('after_id')
+    try:
+        after_id = int(after_id) if after_id else None
+    except ValueError:
+        abort(400)
+    until = review_watermark(after_id) if kind == 'reviews' else None
+
+    response = Response(stream_with_context(export_lines(kind, fmt, after_id, until)), mimetype=MIME_TYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    if until is not None:
+        # С этим значением в after_id следующая выгрузка вернёт только новые рецензии
+        response.headers['X-Export-Watermark'] = str(until)
+    return response
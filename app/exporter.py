@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func
+from models import db, Book, Review, Collection, collection_book_table
+
+# Строк (для collections - подборок) в одном пакете выгрузки
+BATCH_SIZE = 1000
+# Рецензии моложе этого не попадают под отметку: их транзакции могут быть ещё не закоммичены
+WATERMARK_LAG = 300
+
+def books_query(after_id=None, until_id=None):
+    return select(
+        Book.id, Book.title, Book.author, Book.publisher, Book.year, Book.pages,
+        Book.cover_id, Book.reviews_count, Book.average_rating,
+    ).order_by(Book.id)
+
+def reviews_query(after_id=None, until_id=None):
+    # Инкрементальная выгрузка идёт по id, граница отстаёт от текущего момента (см. review_watermark)
+    query = select(
+        Review.id, Review.book_id, Review.user_id, Review.rating, Review.text, Review.timestamp,
+    ).order_by(Review.id)
+    if after_id is not None:
+        query = query.where(Review.id > after_id)
+    if until_id is not None:
+        query = query.where(Review.id <= until_id)
+    return query
+
+def collections_query(after_id=None, until_id=None):
+    # Одна строка на пару (подборка, книга); пустые подборки выгружаются с book_id = NULL
+    return (
+        select(Collection.id, Collection.name, Collection.user_id, collection_book_table.c.book_id)
+        .outerjoin(collection_book_table, collection_book_table.c.collection_id == Collection.id)
+        .order_by(Collection.id, collection_book_table.c.book_id)
+    )
+
+EXPORTS = {
+    'books': books_query,
+    'reviews': reviews_query,
+    'collections': collections_query,
+}
+# Ключ пакетов выгрузки - первый столбец запроса
+EXPORT_KEYS = {
+    'books': Book.id,
+    'reviews': Review.id,
+    'collections': Collection.id,
+}
+# На один ключ приходится несколько строк, поэтому пакет ключей выбирается отдельным запросом
+GROUPED_EXPORTS = {'collections'}
+FORMATS = ('csv', 'jsonl')
+
+def review_watermark(after_id=None):
+    # Верхняя граница выгрузки фиксируется заранее, чтобы экспорт был согласованным срезом.
+    # id выдаётся до коммита, поэтому рецензия с меньшим id может появиться позже большего;
+    # граница берётся среди рецензий старше WATERMARK_LAG, чьи транзакции уже успели завершиться
+    lag = timedelta(seconds=current_app.config.get('EXPORT_WATERMARK_LAG', WATERMARK_LAG))
+    query = select(func.max(Review.id)).where(Review.timestamp <= datetime.utcnow() - lag)
+    if after_id is not None:
+        query = query.where(Review.id > after_id)
+    return db.session.execute(query).scalar() or after_id or 0
+
+def export_rows(kind, after_id=None, until_id=None, batch_size=BATCH_SIZE):
+    # Пакеты по ключу (id > последнего ORDER BY id LIMIT n), как в resanitize_column:
+    # mysqlconnector не поддерживает серверные курсоры, и yield_per прочитал бы всю таблицу в память
+    query = EXPORTS[kind](after_id, until_id)
+    key = EXPORT_KEYS[kind]
+    yield list(query.selected_columns.keys())
+    last_id = None
+    while True:
+        after_last = [] if last_id is None else [key > last_id]
+        if kind in GROUPED_EXPORTS:
+            ids = db.session.execute(
+                select(key).where(*after_last).order_by(key).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            rows = db.session.execute(query.where(key.in_(ids))).all()
+            last_id = ids[-1]
+        else:
+            rows = db.session.execute(query.where(*after_last).limit(batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+        yield from rows
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def format_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if value is None else serialize_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def format_jsonl(rows):
+    columns = next(rows)
+    for row in rows:
+        record = {column: serialize_value(value) for column, value in zip(columns, row)}
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+def export_lines(kind, fmt, after_id=None, until_id=None):
+    rows = export_rows(kind, after_id, until_id)
+    return format_csv(rows) if fmt == 'csv' else format_jsonl(rows)
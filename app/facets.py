@@ -0,0 +1,71 @@
+from collections import Counter
+from sqlalchemy import select, delete, func, literal
+from models import db, Book, Genre, FacetCount, book_genre_table
+from page_cache import CATALOG, bump_generation
+from tools import upsert
+
+GENRE_FACET = 'genre'
+DECADE_FACET = 'decade'
+
+def decade_of(year):
+    year = int(year)
+    return year - year % 10
+
+def book_facets(book):
+    # Набор (фасет, значение), в которые попадает книга
+    facets = {(GENRE_FACET, genre.id) for genre in book.genres}
+    if book.year is not None:
+        facets.add((DECADE_FACET, decade_of(book.year)))
+    return facets
+
+def upsert_increment(rows):
+    # rows: [{'facet', 'value', 'count'}] - прибавить count к существующей строке или вставить новую
+    db.session.execute(upsert(
+        FacetCount.__table__, rows, ['facet', 'value'],
+        lambda new: {'count': FacetCount.count + new['count']},
+    ))
+
+def update_facet_counts(before, after):
+    # before/after - результаты book_facets до и после изменения книги
+    delta = Counter()
+    for key in after - before:
+        delta[key] += 1
+    for key in before - after:
+        delta[key] -= 1
+    rows = [{'facet': facet, 'value': value, 'count': change} for (facet, value), change in delta.items() if change]
+    if rows:
+        upsert_increment(rows)
+
+def facet_summary():
+    genres = db.session.execute(
+        select(Genre.id, Genre.name, FacetCount.count)
+        .join(FacetCount, (FacetCount.facet == GENRE_FACET) & (FacetCount.value == Genre.id))
+        .where(FacetCount.count > 0)
+        .order_by(Genre.name)
+    ).all()
+    decades = db.session.execute(
+        select(FacetCount.value, FacetCount.count)
+        .where(FacetCount.facet == DECADE_FACET, FacetCount.count > 0)
+        .order_by(FacetCount.value.desc())
+    ).all()
+    return {'genres': genres, 'decades': decades}
+
+def filter_books(query, genre_ids=(), decade=None):
+    if genre_ids:
+        query = query.where(Book.genres.any(Genre.id.in_(genre_ids)))
+    if decade is not None:
+        query = query.where(Book.year >= decade, Book.year < decade + 10)
+    return query
+
+def rebuild_facet_counts():
+    db.session.execute(delete(FacetCount))
+    genre_counts = (
+        select(literal(GENRE_FACET), book_genre_table.c.genre_id, func.count())
+        .group_by(book_genre_table.c.genre_id)
+    )
+    decade_column = Book.year - Book.year % 10
+    decade_counts = select(literal(DECADE_FACET), decade_column, func.count()).group_by(decade_column)
+    for counts in (genre_counts, decade_counts):
+        db.session.execute(FacetCount.__table__.insert().from_select(['facet', 'value', 'count'], counts))
+    bump_generation(db.session.connection(), CATALOG)
+    db.session.commit()
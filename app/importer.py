@@ -0,0 +1,233 @@
+import os
+import csv
+import json
+import time
+import mimetypes
+from collections import Counter
+from itertools import islice
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+from sqlalchemy import select, insert
+from models import db, Book, Genre, Cover, ImportCheckpoint, book_genre_table
+from tools import ImageSaver, ImageValidationError
+from rendering import renderer
+from search_index import get_search_backend
+from facets import GENRE_FACET, DECADE_FACET, decade_of, upsert_increment
+from thumbnails import schedule_derivatives, replace_file
+from similar import mark_books_changed
+from page_cache import CATALOG, bump_generation
+
+REQUIRED_FIELDS = ('title', 'author', 'publisher', 'year', 'pages', 'cover')
+
+class ImportRecordError(ValueError):
+    pass
+
+def read_records(path, fmt='auto'):
+    # Источник читается построчно, весь файл в память не загружается
+    if fmt == 'auto':
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    with open(path, encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+def parse_genres(value):
+    if isinstance(value, list):
+        return [name.strip() for name in value if name.strip()]
+    return [name.strip() for name in (value or '').replace(';', ',').split(',') if name.strip()]
+
+class CatalogImporter:
+    def __init__(self, source, covers_dir, batch_size=1000, fmt='auto', skip_invalid=False):
+        self.source = os.path.abspath(source)
+        self.covers_dir = covers_dir
+        self.batch_size = batch_size
+        self.fmt = fmt
+        self.skip_invalid = skip_invalid
+        self.upload_folder = current_app.config['UPLOAD_FOLDER']
+        self.search_backend = get_search_backend()
+        self.genres = {genre.name: genre.id for genre in db.session.execute(select(Genre)).scalars()}
+        # Путь к файлу обложки -> id обложки: один и тот же файл хэшируется один раз за запуск
+        self.covers_by_path = {}
+        self.imported = 0
+        self.skipped = 0
+
+    def checkpoint(self):
+        checkpoint = db.session.get(ImportCheckpoint, self.source)
+        if checkpoint is None:
+            checkpoint = ImportCheckpoint(source=self.source, position=0)
+            db.session.add(checkpoint)
+        return checkpoint
+
+    def reset(self):
+        checkpoint = db.session.get(ImportCheckpoint, self.source)
+        if checkpoint is not None:
+            db.session.delete(checkpoint)
+            db.session.commit()
+
+    def cover_path(self, record):
+        return os.path.join(self.covers_dir, record['cover'])
+
+    def read_cover(self, path):
+        if not os.path.isfile(path):
+            raise ImportRecordError(f'Файл обложки не найден: {path}')
+        mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as stream:
+            saver = ImageSaver(FileStorage(stream=stream, filename=os.path.basename(path), content_type=mime_type))
+            try:
+                temp_path, md5_hash = saver.stream_to_temp(self.upload_folder)
+            except ImageValidationError as err:
+                raise ImportRecordError(f'{path}: {err}')
+        return saver, temp_path, md5_hash
+
+    def cover_files(self, records):
+        # Хэшируем ещё не встречавшиеся файлы и одним запросом находим уже сохранённые обложки
+        pending = {}
+        for record in records:
+            path = self.cover_path(record)
+            if path in self.covers_by_path or path in pending:
+                continue
+            try:
+                pending[path] = self.read_cover(path)
+            except ImportRecordError:
+                if not self.skip_invalid:
+                    raise
+        if not pending:
+            return
+
+        hashes = {md5_hash for _, _, md5_hash in pending.values()}
+        existing = {
+            cover.md5_hash: cover.id
+            for cover in db.session.execute(select(Cover).where(Cover.md5_hash.in_(hashes))).scalars()
+        }
+        new_covers = {}
+        for path, (saver, temp_path, md5_hash) in pending.items():
+            if md5_hash in existing:
+                os.remove(temp_path)
+                self.covers_by_path[path] = existing[md5_hash]
+                continue
+            if md5_hash not in new_covers:
+                storage_filename = saver.storage_filename(md5_hash)
+                replace_file(temp_path, os.path.join(self.upload_folder, storage_filename))
+                new_covers[md5_hash] = Cover(filename=saver.file.filename, mime_type=saver.file.mimetype, md5_hash=md5_hash)
+            else:
+                os.remove(temp_path)
+        db.session.add_all(new_covers.values())
+        db.session.flush()
+        for path, (_, _, md5_hash) in pending.items():
+            if path not in self.covers_by_path:
+                self.covers_by_path[path] = new_covers[md5_hash].id
+        for cover in new_covers.values():
+            schedule_derivatives(cover.storage_filename)
+
+    def genre_ids(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.genres]
+        if missing:
+            genres = [Genre(name=name) for name in missing]
+            db.session.add_all(genres)
+            db.session.flush()
+            self.genres.update({genre.name: genre.id for genre in genres})
+        return [self.genres[name] for name in dict.fromkeys(names)]
+
+    def validate(self, record):
+        missing = [field for field in REQUIRED_FIELDS if not str(record.get(field) or '').strip()]
+        if missing:
+            raise ImportRecordError(f'Не заполнены поля: {", ".join(missing)}')
+        try:
+            int(record['year'])
+            int(record['pages'])
+        except (TypeError, ValueError):
+            raise ImportRecordError('Поля year и pages должны быть целыми числами')
+
+    def insert_books(self, rows):
+        # Один INSERT с RETURNING на пакет вместо flush ORM; id возвращаются в порядке строк
+        if not rows:
+            return []
+        table = Book.__table__
+        if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+            ids = db.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+        else:
+            # MySQL не поддерживает RETURNING: id каждой книги - lastrowid её INSERT
+            ids = [db.session.execute(insert(table), row).inserted_primary_key[0] for row in rows]
+        # Изменения мимо flush не видит invalidate_catalog, поэтому поколение сдвигается явно
+        bump_generation(db.session.connection(), CATALOG)
+        # Несохраняемые объекты - только для индекса, фасетов и очереди похожих книг
+        return [Book(id=book_id, **row) for book_id, row in zip(ids, rows)]
+
+    def import_batch(self, records):
+        valid = []
+        for record in records:
+            try:
+                self.validate(record)
+                valid.append(record)
+            except ImportRecordError:
+                if not self.skip_invalid:
+                    raise
+                self.skipped += 1
+        self.cover_files(valid)
+        with_cover = [record for record in valid if self.cover_path(record) in self.covers_by_path]
+        self.skipped += len(valid) - len(with_cover)
+        valid = with_cover
+
+        descriptions = renderer.render_many(record.get('description') or '' for record in valid)
+        rows = [
+            {
+                'title': record['title'],
+                'author': record['author'],
+                'publisher': record['publisher'],
+                'year': int(record['year']),
+                'pages': int(record['pages']),
+                'description': description,
+                'cover_id': self.covers_by_path[self.cover_path(record)],
+            }
+            for record, description in zip(valid, descriptions)
+        ]
+        books = self.insert_books(rows)
+
+        # Связи с жанрами и счётчики фасетов пишутся одной пачкой на весь пакет
+        links = []
+        facet_delta = Counter()
+        for book, record in zip(books, valid):
+            genre_ids = self.genre_ids(parse_genres(record.get('genres')))
+            links.extend({'book_id': book.id, 'genre_id': genre_id} for genre_id in genre_ids)
+            facet_delta.update((GENRE_FACET, genre_id) for genre_id in genre_ids)
+            facet_delta[(DECADE_FACET, decade_of(book.year))] += 1
+        if links:
+            db.session.execute(book_genre_table.insert(), links)
+        if facet_delta:
+            upsert_increment([
+                {'facet': facet, 'value': value, 'count': count}
+                for (facet, value), count in facet_delta.items()
+            ])
+        self.search_backend.index_books(books)
+        mark_books_changed(book.id for book in books)
+        self.imported += len(books)
+        # Обложки и жанры пакета больше не нужны в identity map - память не растёт от пакета к пакету
+        db.session.expunge_all()
+
+    def run(self, progress=None):
+        checkpoint = self.checkpoint()
+        position = checkpoint.position
+        db.session.commit()
+        records = islice(read_records(self.source, self.fmt), position, None)
+        started = time.monotonic()
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            try:
+                self.import_batch(batch)
+                position += len(batch)
+                self.checkpoint().position = position
+                db.session.commit()
+            except BaseException:
+                db.session.rollback()
+                raise
+            if progress:
+                elapsed = time.monotonic() - started
+                progress(position, self.imported, self.imported / elapsed if elapsed else 0.0)
+        return position
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('webexam.performance')
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+SLOWEST_LIMIT = 5
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.timings = Counter()
+        self._template_starts = []
+
+    @property
+    def db_ms(self):
+        return sum(duration for _, duration, _ in self.queries)
+
+    def repeated_statements(self, threshold):
+        # Один и тот же SQL много раз за запрос - типичный признак N+1
+        counts = Counter(statement for statement, _, _ in self.queries)
+        return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+    def slowest(self):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:SLOWEST_LIMIT]
+
+def current_profile():
+    if has_app_context():
+        return g.get('profile')
+    return None
+
+@contextmanager
+def timed(name):
+    # Замер участка кода (markdown, bleach, ...) в рамках текущего запроса; без профиля ничего не делает
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] += (time.perf_counter() - started) * 1000
+
+def call_site():
+    # Первая строка стека из кода приложения, а не из SQLAlchemy/Flask
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(APP_ROOT) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, APP_ROOT)}:{frame.lineno} ({frame.name})'
+    return None
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    starts = conn.info.get('query_started')
+    if profile is None or not starts:
+        return
+    duration = (time.perf_counter() - starts.pop()) * 1000
+    profile.queries.append((statement, duration, call_site()))
+
+def template_started(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile._template_starts.append(time.perf_counter())
+
+def template_finished(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile._template_starts:
+        profile.timings['render'] += (time.perf_counter() - profile._template_starts.pop()) * 1000
+
+def init_instrumentation(app):
+    # Включается настройкой INSTRUMENTATION_ENABLED; по умолчанию накладных расходов нет
+    if not app.config.get('INSTRUMENTATION_ENABLED', False):
+        return
+    slow_request_ms = app.config.get('SLOW_REQUEST_MS', 500)
+    slow_query_ms = app.config.get('SLOW_QUERY_MS', 100)
+    repeated_threshold = app.config.get('REPEATED_QUERY_THRESHOLD', 5)
+
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+
+    @app.before_request
+    def start_profile():
+        g.profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        metrics = [f'db;dur={profile.db_ms:.1f};desc="{len(profile.queries)} queries"']
+        metrics += [f'{name};dur={duration:.1f}' for name, duration in sorted(profile.timings.items())]
+        metrics.append(f'total;dur={total_ms:.1f}')
+        response.headers['Server-Timing'] = ', '.join(metrics)
+
+        repeated = profile.repeated_statements(repeated_threshold)
+        slow_queries = [query for query in profile.queries if query[1] >= slow_query_ms]
+        if total_ms >= slow_request_ms or slow_queries or repeated:
+            logger.warning(json.dumps({
+                'event': 'slow_request' if total_ms >= slow_request_ms else 'suspicious_queries',
+                'method': request.method,
+                'path': request.full_path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(profile.db_ms, 1),
+                'query_count': len(profile.queries),
+                'timings_ms': {name: round(duration, 1) for name, duration in profile.timings.items()},
+                'slowest': [
+                    {'statement': statement, 'ms': round(duration, 1), 'call_site': site}
+                    for statement, duration, site in profile.slowest()
+                ],
+                'likely_n_plus_one': [
+                    {'statement': statement, 'count': count} for statement, count in repeated
+                ],
+            }, ensure_ascii=False))
+        return response
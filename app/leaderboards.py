@@ -0,0 +1,183 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from sqlalchemy import select, delete, update, insert, event, func, literal, bindparam, true
+from models import db, Book, Genre, Review, BookRanking, LeaderboardState, book_genre_table
+from page_cache import CATALOG, bump_generation
+from tools import upsert
+
+# genre_id строк общего рейтинга
+OVERALL = 0
+# Начало отсчёта трендов, пока flask leaderboards rebuild не записал своё
+DEFAULT_TRENDING_EPOCH = datetime(2024, 1, 1)
+# При пересборке рецензии старше стольких периодов полураспада не учитываются: их вклад < 0.1%
+TRENDING_HORIZON = 10
+
+def half_life():
+    return timedelta(days=current_app.config.get('TRENDING_HALF_LIFE_DAYS', 7))
+
+def default_state():
+    config = current_app.config
+    return config.get('LEADERBOARD_PRIOR_MEAN', 3.0), config.get('LEADERBOARD_PRIOR_WEIGHT', 5.0), DEFAULT_TRENDING_EPOCH
+
+def current_state(connection):
+    state = connection.execute(
+        select(LeaderboardState.prior_mean, LeaderboardState.prior_weight, LeaderboardState.trending_epoch)
+    ).first()
+    return tuple(state) if state is not None else default_state()
+
+def bayesian_rating(rating_sum, reviews_count, prior_mean, prior_weight):
+    # Среднее, сдвинутое к средней оценке каталога: книга с одной пятёркой не обгоняет книгу с сотней четвёрок
+    return (prior_weight * prior_mean + rating_sum) / (prior_weight + reviews_count)
+
+def trending_weight(timestamp, epoch):
+    return 2.0 ** ((timestamp - epoch) / half_life())
+
+def review_changed(connection, review, sign):
+    # Агрегаты книги к этому моменту уже обновлены слушателями в models.py
+    rows = connection.execute(
+        select(Book.rating_sum, Book.reviews_count, book_genre_table.c.genre_id,
+               LeaderboardState.prior_mean, LeaderboardState.prior_weight, LeaderboardState.trending_epoch)
+        .outerjoin(book_genre_table, book_genre_table.c.book_id == Book.id)
+        .outerjoin(LeaderboardState, true())
+        .where(Book.id == review.book_id)
+    ).all()
+    if not rows:
+        return
+    rating_sum, reviews_count, _, *state = rows[0]
+    if not reviews_count:
+        connection.execute(delete(BookRanking.__table__).where(BookRanking.book_id == review.book_id))
+        return
+    prior_mean, prior_weight, epoch = state if state[0] is not None else default_state()
+    score = bayesian_rating(rating_sum, reviews_count, prior_mean, prior_weight)
+    weight = sign * trending_weight(review.timestamp, epoch)
+    genre_ids = {OVERALL} | {row.genre_id for row in rows if row.genre_id is not None}
+    connection.execute(upsert(
+        BookRanking.__table__,
+        [{'genre_id': genre_id, 'book_id': review.book_id, 'bayesian_rating': score, 'trending': max(weight, 0.0)}
+         for genre_id in genre_ids],
+        ['genre_id', 'book_id'],
+        lambda new: {'bayesian_rating': new['bayesian_rating'], 'trending': BookRanking.trending + weight},
+    ))
+
+@event.listens_for(Review, 'after_insert')
+def review_inserted(mapper, connection, target):
+    review_changed(connection, target, 1)
+
+@event.listens_for(Review, 'after_delete')
+def review_deleted(mapper, connection, target):
+    review_changed(connection, target, -1)
+
+def update_ranking_genres(book_id, before, after):
+    # Строки жанров книги копируются из общей строки: оценки от жанра не зависят
+    removed = before - after
+    if removed:
+        db.session.execute(delete(BookRanking).where(BookRanking.book_id == book_id, BookRanking.genre_id.in_(sorted(removed))))
+    for genre_id in after - before:
+        db.session.execute(insert(BookRanking).from_select(
+            ['genre_id', 'book_id', 'bayesian_rating', 'trending'],
+            select(literal(genre_id), BookRanking.book_id, BookRanking.bayesian_rating, BookRanking.trending)
+            .where(BookRanking.book_id == book_id, BookRanking.genre_id == OVERALL),
+        ))
+
+def remove_book_rankings(book_id):
+    db.session.execute(delete(BookRanking).where(BookRanking.book_id == book_id))
+
+def top_rated(genre_id=OVERALL, limit=10):
+    return db.session.execute(
+        select(Book.id, Book.title, Book.average_rating, Book.reviews_count, BookRanking.bayesian_rating.label('score'))
+        .join(BookRanking, BookRanking.book_id == Book.id)
+        .where(BookRanking.genre_id == genre_id)
+        .order_by(BookRanking.bayesian_rating.desc(), Book.id)
+        .limit(limit)
+    ).all()
+
+def trending(genre_id=OVERALL, limit=10):
+    # score - число рецензий, где рецензия давностью в период полураспада считается за половину
+    _, _, epoch = current_state(db.session)
+    scale = trending_weight(datetime.utcnow(), epoch)
+    minimum = current_app.config.get('TRENDING_MIN_SCORE', 0.5) * scale
+    rows = db.session.execute(
+        select(Book.id, Book.title, Book.average_rating, Book.reviews_count, BookRanking.trending)
+        .join(BookRanking, BookRanking.book_id == Book.id)
+        .where(BookRanking.genre_id == genre_id, BookRanking.trending >= minimum)
+        .order_by(BookRanking.trending.desc(), Book.id)
+        .limit(limit)
+    ).all()
+    return [(book_id, title, average_rating, reviews_count, weight / scale)
+            for book_id, title, average_rating, reviews_count, weight in rows]
+
+def render_leaderboards(genre_id=OVERALL):
+    limit = current_app.config.get('LEADERBOARD_SIZE', 5)
+    genre = db.session.get(Genre, genre_id) if genre_id != OVERALL else None
+    return render_template('books/_leaderboards.html', genre=genre,
+                           top_rated=top_rated(genre_id, limit), trending=trending(genre_id, limit))
+
+def save_state(prior_mean, prior_weight, epoch):
+    db.session.execute(delete(LeaderboardState))
+    db.session.add(LeaderboardState(id=1, prior_mean=prior_mean, prior_weight=prior_weight, trending_epoch=epoch))
+
+def catalog_prior():
+    # Средняя оценка по агрегатам книг, без чтения таблицы reviews
+    default_mean, prior_weight, _ = default_state()
+    rating_sum, reviews_count = db.session.execute(
+        select(func.sum(Book.rating_sum), func.sum(Book.reviews_count))
+    ).one()
+    prior_mean = rating_sum / reviews_count if reviews_count else default_mean
+    return float(prior_mean), float(prior_weight)
+
+def bayesian_column(prior_mean, prior_weight):
+    return (literal(prior_weight * prior_mean) + Book.rating_sum) / (literal(prior_weight) + Book.reviews_count)
+
+def refresh_leaderboards():
+    # Новая средняя по каталогу и Bayesian-оценки всех строк; тренды не трогаются
+    _, _, epoch = current_state(db.session)
+    prior_mean, prior_weight = catalog_prior()
+    save_state(prior_mean, prior_weight, epoch)
+    # Строки книг, оставшихся без рецензий или удалённых
+    removed = db.session.execute(delete(BookRanking).where(
+        BookRanking.book_id.not_in(select(Book.id).where(Book.reviews_count > 0))
+    )).rowcount
+    db.session.execute(update(BookRanking.__table__).values(bayesian_rating=(
+        select(bayesian_column(prior_mean, prior_weight)).where(Book.id == BookRanking.book_id).scalar_subquery()
+    )))
+    bump_generation(db.session.connection(), CATALOG)
+    db.session.commit()
+    return prior_mean, removed
+
+def rebuild_leaderboards():
+    # Полная пересборка с новым началом отсчёта трендов; читает только рецензии за TRENDING_HORIZON
+    now = datetime.utcnow()
+    epoch = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    prior_mean, prior_weight = catalog_prior()
+    save_state(prior_mean, prior_weight, epoch)
+    db.session.execute(delete(BookRanking))
+    score = bayesian_column(prior_mean, prior_weight)
+    columns = ['genre_id', 'book_id', 'bayesian_rating', 'trending']
+    db.session.execute(insert(BookRanking).from_select(
+        columns, select(literal(OVERALL), Book.id, score, literal(0.0)).where(Book.reviews_count > 0)))
+    db.session.execute(insert(BookRanking).from_select(
+        columns,
+        select(book_genre_table.c.genre_id, Book.id, score, literal(0.0))
+        .join(book_genre_table, book_genre_table.c.book_id == Book.id)
+        .where(Book.reviews_count > 0),
+    ))
+
+    weights = defaultdict(float)
+    recent = db.session.execute(
+        select(Review.book_id, Review.timestamp).where(Review.timestamp >= now - TRENDING_HORIZON * half_life())
+    )
+    for book_id, timestamp in recent:
+        weights[book_id] += trending_weight(timestamp, epoch)
+    if weights:
+        db.session.execute(
+            update(BookRanking.__table__)
+            .where(BookRanking.book_id == bindparam('ranked_book_id'))
+            .values(trending=bindparam('weight')),
+            [{'ranked_book_id': book_id, 'weight': weight} for book_id, weight in weights.items()],
+        )
+    bump_generation(db.session.connection(), CATALOG)
+    db.session.commit()
+    return db.session.execute(
+        select(func.count()).select_from(BookRanking).where(BookRanking.genre_id == OVERALL)
+    ).scalar()
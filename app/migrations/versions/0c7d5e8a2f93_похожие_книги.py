@@ -0,0 +1,38 @@
+"""Похожие книги
+
+Revision ID: 0c7d5e8a2f93
+Revises: 6a2f9c4e1b07
+Create Date: 2024-07-08 12:47:09.338105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c7d5e8a2f93'
+down_revision = '6a2f9c4e1b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_similarities',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('similar_book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], name=op.f('fk_book_similarities_book_id_books'), ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_book_id'], ['books.id'], name=op.f('fk_book_similarities_similar_book_id_books'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'similar_book_id', name=op.f('pk_book_similarities'))
+    )
+    op.create_index('ix_book_similarities_book_id_score', 'book_similarities', ['book_id', 'score'], unique=False)
+    op.create_table('similarity_queue',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('book_id', name=op.f('pk_similarity_queue'))
+    )
+
+
+def downgrade():
+    op.drop_table('similarity_queue')
+    op.drop_index('ix_book_similarities_book_id_score', table_name='book_similarities')
+    op.drop_table('book_similarities')
@@ -0,0 +1,29 @@
+"""Таблица контрольных точек импорта
+
+Revision ID: 3c5a8e1f6b72
+Revises: 7f41c6a2d9b8
+Create Date: 2024-06-28 09:15:37.402817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5a8e1f6b72'
+down_revision = '7f41c6a2d9b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_checkpoints',
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+    sa.PrimaryKeyConstraint('source', name=op.f('pk_import_checkpoints'))
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoints')
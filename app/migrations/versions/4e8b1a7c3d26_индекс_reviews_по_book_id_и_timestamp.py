@@ -0,0 +1,24 @@
+"""Индекс reviews по book_id и timestamp
+
+Revision ID: 4e8b1a7c3d26
+Revises: d6e19a4b3c80
+Create Date: 2024-07-02 09:41:27.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b1a7c3d26'
+down_revision = 'd6e19a4b3c80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_reviews_book_id_timestamp', 'reviews', ['book_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_reviews_book_id_timestamp', table_name='reviews')
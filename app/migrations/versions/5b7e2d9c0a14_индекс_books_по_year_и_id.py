@@ -0,0 +1,24 @@
+"""Индекс books по year и id
+
+Revision ID: 5b7e2d9c0a14
+Revises: c4a1e7b9d2f3
+Create Date: 2024-06-21 10:34:05.127733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2d9c0a14'
+down_revision = 'c4a1e7b9d2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_books_year_id', 'books', ['year', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_books_year_id', table_name='books')
@@ -0,0 +1,29 @@
+"""Таблица ограничения попыток входа
+
+Revision ID: 6a2f9c4e1b07
+Revises: b5f07d3e9a41
+Create Date: 2024-07-05 16:02:38.114590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2f9c4e1b07'
+down_revision = 'b5f07d3e9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('throttle_buckets',
+    sa.Column('bucket', sa.String(length=255), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket', name=op.f('pk_throttle_buckets'))
+    )
+
+
+def downgrade():
+    op.drop_table('throttle_buckets')
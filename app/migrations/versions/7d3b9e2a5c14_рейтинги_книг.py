@@ -0,0 +1,46 @@
+"""Рейтинги лучших и обсуждаемых книг
+
+Revision ID: 7d3b9e2a5c14
+Revises: 0c7d5e8a2f93
+Create Date: 2024-07-09 11:20:41.573902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b9e2a5c14'
+down_revision = '0c7d5e8a2f93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Заполняется командой "flask leaderboards rebuild".
+    op.create_table('book_rankings',
+    sa.Column('genre_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('bayesian_rating', sa.Float(), nullable=False),
+    sa.Column('trending', sa.Double(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], name=op.f('fk_book_rankings_book_id_books'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('genre_id', 'book_id', name=op.f('pk_book_rankings'))
+    )
+    op.create_index(op.f('ix_book_rankings_book_id'), 'book_rankings', ['book_id'], unique=False)
+    op.create_index('ix_book_rankings_genre_id_bayesian_rating', 'book_rankings', ['genre_id', 'bayesian_rating'], unique=False)
+    op.create_index('ix_book_rankings_genre_id_trending', 'book_rankings', ['genre_id', 'trending'], unique=False)
+    op.create_table('leaderboard_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('prior_mean', sa.Float(), nullable=False),
+    sa.Column('prior_weight', sa.Float(), nullable=False),
+    sa.Column('trending_epoch', sa.TIMESTAMP(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_leaderboard_state'))
+    )
+
+
+def downgrade():
+    op.drop_table('leaderboard_state')
+    op.drop_index('ix_book_rankings_genre_id_trending', table_name='book_rankings')
+    op.drop_index('ix_book_rankings_genre_id_bayesian_rating', table_name='book_rankings')
+    op.drop_index(op.f('ix_book_rankings_book_id'), table_name='book_rankings')
+    op.drop_table('book_rankings')
@@ -0,0 +1,28 @@
+"""Версии строк books, reviews, collections
+
+Revision ID: 7f41c6a2d9b8
+Revises: e2c84b07f5d1
+Create Date: 2024-06-27 14:21:56.684020
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f41c6a2d9b8'
+down_revision = 'e2c84b07f5d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('books', 'reviews', 'collections'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in ('collections', 'reviews', 'books'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
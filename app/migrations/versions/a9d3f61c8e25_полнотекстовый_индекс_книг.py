@@ -0,0 +1,41 @@
+"""Полнотекстовый индекс книг
+
+Revision ID: a9d3f61c8e25
+Revises: 5b7e2d9c0a14
+Create Date: 2024-06-24 16:02:48.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3f61c8e25'
+down_revision = '5b7e2d9c0a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица индекса зависит от СУБД: FULLTEXT в MySQL, виртуальная таблица FTS5 в SQLite.
+    # Заполняется командой "flask search rebuild".
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE IF NOT EXISTS book_search '
+                   'USING fts5(book_id UNINDEXED, title, author, publisher, body)')
+        return
+    op.create_table('book_search',
+    sa.Column('book_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.Column('author', sa.String(length=100), nullable=False),
+    sa.Column('publisher', sa.String(length=100), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('book_id', name=op.f('pk_book_search')),
+    mysql_engine='InnoDB',
+    mysql_charset='utf8mb4'
+    )
+    op.create_index('ix_book_search_fulltext', 'book_search', ['title', 'author', 'publisher', 'body'],
+                    unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS book_search')
@@ -0,0 +1,29 @@
+"""Сборка неиспользуемых обложек
+
+Revision ID: b5f07d3e9a41
+Revises: 4e8b1a7c3d26
+Create Date: 2024-07-03 11:18:42.660214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f07d3e9a41'
+down_revision = '4e8b1a7c3d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Существующие обложки остаются с NULL и считаются давно загруженными
+    with op.batch_alter_table('covers') as batch_op:
+        batch_op.add_column(sa.Column('last_used_at', sa.TIMESTAMP(), nullable=True))
+    op.create_index('ix_books_cover_id', 'books', ['cover_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_books_cover_id', table_name='books')
+    with op.batch_alter_table('covers') as batch_op:
+        batch_op.drop_column('last_used_at')
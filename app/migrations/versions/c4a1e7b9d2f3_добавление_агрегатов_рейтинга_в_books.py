@@ -0,0 +1,41 @@
+"""Добавление агрегатов рейтинга в books
+
+Revision ID: c4a1e7b9d2f3
+Revises: 8e0d3d58ab1d
+Create Date: 2024-06-20 12:10:42.518201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a1e7b9d2f3'
+down_revision = '8e0d3d58ab1d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('reviews_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('average_rating', sa.Float(), nullable=True))
+
+    # Заполняем агрегаты по уже существующим рецензиям
+    op.execute("""
+        UPDATE books SET
+            rating_sum = (SELECT COALESCE(SUM(r.rating), 0) FROM reviews r WHERE r.book_id = books.id),
+            reviews_count = (SELECT COUNT(r.id) FROM reviews r WHERE r.book_id = books.id)
+    """)
+    op.execute("""
+        UPDATE books SET average_rating = ROUND(rating_sum * 1.0 / reviews_count, 2)
+        WHERE reviews_count > 0
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_column('average_rating')
+        batch_op.drop_column('reviews_count')
+        batch_op.drop_column('rating_sum')
@@ -0,0 +1,29 @@
+"""Таблица поколений кэша
+
+Revision ID: d6e19a4b3c80
+Revises: 3c5a8e1f6b72
+Create Date: 2024-07-01 10:05:11.917342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6e19a4b3c80'
+down_revision = '3c5a8e1f6b72'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_generations = op.create_table('cache_generations',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name', name=op.f('pk_cache_generations'))
+    )
+    op.bulk_insert(cache_generations, [{'name': 'catalog', 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_generations')
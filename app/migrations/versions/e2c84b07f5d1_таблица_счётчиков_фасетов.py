@@ -0,0 +1,38 @@
+"""Таблица счётчиков фасетов
+
+Revision ID: e2c84b07f5d1
+Revises: a9d3f61c8e25
+Create Date: 2024-06-25 11:47:19.330561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c84b07f5d1'
+down_revision = 'a9d3f61c8e25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('facet_counts',
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value', name=op.f('pk_facet_counts'))
+    )
+    # Начальное заполнение по существующим книгам
+    op.execute("""
+        INSERT INTO facet_counts (facet, value, count)
+        SELECT 'genre', genre_id, COUNT(*) FROM book_genre GROUP BY genre_id
+    """)
+    op.execute("""
+        INSERT INTO facet_counts (facet, value, count)
+        SELECT 'decade', year - year % 10, COUNT(*) FROM books GROUP BY year - year % 10
+    """)
+
+
+def downgrade():
+    op.drop_table('facet_counts')
@@ -0,0 +1,29 @@
+"""Двойная точность token bucket
+
+Revision ID: e3b8d1f5a7c2
+Revises: 7d3b9e2a5c14
+Create Date: 2024-07-11 10:14:52.307816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8d1f5a7c2'
+down_revision = '7d3b9e2a5c14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FLOAT в MySQL - одинарная точность: время в секундах эпохи округлялось до 128 с
+    with op.batch_alter_table('throttle_buckets') as batch_op:
+        batch_op.alter_column('tokens', existing_type=sa.Float(), type_=sa.Double(), existing_nullable=False)
+        batch_op.alter_column('updated_at', existing_type=sa.Float(), type_=sa.Double(), existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('throttle_buckets') as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.Double(), type_=sa.Float(), existing_nullable=False)
+        batch_op.alter_column('tokens', existing_type=sa.Double(), type_=sa.Float(), existing_nullable=False)
@@ -1,14 +1,16 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, ForeignKey, Text, Integer, Table, Column, MetaData, TIMESTAMP
+from sqlalchemy import String, ForeignKey, Text, Integer, Float, Double, Table, Column, MetaData, TIMESTAMP, Index, event, update, func, cast, case
 from werkzeug.security import check_password_hash, generate_password_hash
 from flask_login import UserMixin
 from check_rights import CheckRights
-from flask import url_for
+from flask import url_for, g, has_app_context
 import os
 from configure import ADMIN_ROLE_ID, MODERATOR_ROLE_ID, USER_ROLE_ID
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
+from passwords import hash_password
 
 class Base(DeclarativeBase):
     metadata = MetaData(naming_convention={
@@ -19,7 +21,7 @@ class Base(DeclarativeBase):
         "pk": "pk_%(table_name)s"
     })
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 class Role(Base):
     __tablename__ = 'roles'
@@ -46,7 +48,7 @@ class User(Base, UserMixin):
     collections = relationship("Collection", back_populates="user", cascade="all, delete, delete-orphan")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -68,12 +70,27 @@ class User(Base, UserMixin):
         return USER_ROLE_ID == self.role_id
     
     def can(self, action, record=None):
+        # Решение запоминается до конца запроса: шаблоны спрашивают одно и то же для каждой строки
+        if not has_app_context():
+            return self._check_right(action, record)
+        permissions = g.setdefault('permissions', {})
+        key = (self.id, action, permission_record_key(record))
+        if key not in permissions:
+            permissions[key] = self._check_right(action, record)
+        return permissions[key]
+
+    def _check_right(self, action, record):
         check_rights = CheckRights(record)
         method = getattr(check_rights, action, None)
         if method:
             return method()
         return False
 
+def permission_record_key(record):
+    if record is None:
+        return None
+    return (type(record).__name__, getattr(record, 'id', id(record)))
+
 class Genre(Base):
     __tablename__ = 'genres'
 
@@ -87,6 +104,8 @@ class Cover(Base):
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
     mime_type: Mapped[str] = mapped_column(String(100), nullable=False)
     md5_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    # Время загрузки или повторного использования; сборщик не трогает свежие обложки
+    last_used_at: Mapped[datetime | None] = mapped_column(TIMESTAMP, nullable=True, default=datetime.utcnow)
     books = relationship("Book", back_populates="cover")
 
     def __repr__(self):
@@ -101,6 +120,9 @@ class Cover(Base):
     def url(self):
         return url_for('image', image_id=self.id, _external=True)
 
+    def sized_url(self, size):
+        return url_for('image', image_id=self.id, size=size, _external=True)
+
 book_genre_table = Table('book_genre', Base.metadata,
     Column('book_id', Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
     Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True)
@@ -108,6 +130,9 @@ book_genre_table = Table('book_genre', Base.metadata,
 
 class Book(Base):
     __tablename__ = 'books'
+    __table_args__ = (
+        Index('ix_books_year_id', 'year', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -116,27 +141,35 @@ class Book(Base):
     publisher: Mapped[str] = mapped_column(String(100), nullable=False)
     author: Mapped[str] = mapped_column(String(100), nullable=False)
     pages: Mapped[int] = mapped_column(Integer, nullable=False)
-    cover_id: Mapped[int] = mapped_column(Integer, ForeignKey('covers.id'), nullable=False)
+    cover_id: Mapped[int] = mapped_column(Integer, ForeignKey('covers.id'), nullable=False, index=True)
+    # Агрегаты рецензий хранятся в таблице и обновляются при добавлении/удалении рецензий
+    rating_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    reviews_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    average_rating: Mapped[float | None] = mapped_column(Float, nullable=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1')
 
     cover = relationship("Cover", back_populates="books", single_parent=True)
     genres = relationship("Genre", secondary=book_genre_table, back_populates="books")
     reviews = relationship("Review", back_populates="book", cascade="all, delete, delete-orphan")
-    collections = relationship("Collection", secondary='collection_book', back_populates="books", cascade="all")
+    # Удаление книги убирает только её строки из collection_book, сами подборки остаются
+    collections = relationship("Collection", secondary='collection_book', back_populates="books")
 
-    @property
-    def average_rating(self):
-        if self.reviews:
-            return round(sum(review.rating for review in self.reviews) / len(self.reviews), 2)
-        return None
+Genre.books = relationship("Book", secondary=book_genre_table, back_populates="genres")
 
-    @property
-    def reviews_count(self):
-        return len(self.reviews)
+class FacetCount(Base):
+    # Предрассчитанное число книг в разрезе фасета: жанр (value = genre_id) или десятилетие (value = 1990, ...)
+    __tablename__ = 'facet_counts'
 
-Genre.books = relationship("Book", secondary=book_genre_table, back_populates="genres")
+    facet: Mapped[str] = mapped_column(String(20), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
 
 class Review(Base):
     __tablename__ = 'reviews'
+    # Страница рецензий книги читается по (book_id, timestamp, id) от новых к старым
+    __table_args__ = (
+        Index('ix_reviews_book_id_timestamp', 'book_id', 'timestamp', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     book_id: Mapped[int] = mapped_column(ForeignKey('books.id'), nullable=False)
@@ -144,19 +177,118 @@ class Review(Base):
     rating: Mapped[int] = mapped_column(Integer, nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1')
 
     book = relationship("Book", back_populates="reviews")
     user = relationship("User", back_populates="reviews")
 
+def rating_aggregates_update(book_id, rating_delta, count_delta):
+    # Атомарное изменение агрегатов одной книги без загрузки её рецензий
+    new_sum = Book.rating_sum + rating_delta
+    new_count = Book.reviews_count + count_delta
+    return (
+        update(Book)
+        .where(Book.id == book_id)
+        .values(
+            rating_sum=new_sum,
+            reviews_count=new_count,
+            average_rating=case(
+                (new_count > 0, func.round(cast(new_sum, Float) / new_count, 2)),
+                else_=None,
+            ),
+            version=Book.version + 1,
+        )
+    )
+
+@event.listens_for(Review, 'after_insert')
+def review_inserted(mapper, connection, target):
+    connection.execute(rating_aggregates_update(target.book_id, int(target.rating), 1))
+
+@event.listens_for(Review, 'after_delete')
+def review_deleted(mapper, connection, target):
+    connection.execute(rating_aggregates_update(target.book_id, -int(target.rating), -1))
+
 class Collection(Base):
     __tablename__ = 'collections'
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1')
 
     user = relationship("User", back_populates="collections")
-    books = relationship("Book", secondary='collection_book', back_populates="collections", cascade="all, delete")
+    books = relationship("Book", secondary='collection_book', back_populates="collections")
+
+class ImportCheckpoint(Base):
+    # Сколько записей источника уже загружено; обновляется в одной транзакции с пакетом книг
+    __tablename__ = 'import_checkpoints'
+
+    source: Mapped[str] = mapped_column(String(255), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class BookSimilarity(Base):
+    # Предрассчитанные top-N похожих книг: строки пересобираются командами flask similar
+    __tablename__ = 'book_similarities'
+    __table_args__ = (
+        Index('ix_book_similarities_book_id_score', 'book_id', 'score'),
+    )
+
+    book_id: Mapped[int] = mapped_column(ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    similar_book_id: Mapped[int] = mapped_column(ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+
+class SimilarityQueue(Base):
+    # Книги, чьи подборки или жанры изменились после последнего пересчёта похожих
+    __tablename__ = 'similarity_queue'
+
+    book_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+class BookRanking(Base):
+    # Материализованные рейтинги книги с рецензиями: общий (genre_id = 0) и по каждому её жанру
+    __tablename__ = 'book_rankings'
+    __table_args__ = (
+        Index('ix_book_rankings_genre_id_bayesian_rating', 'genre_id', 'bayesian_rating'),
+        Index('ix_book_rankings_genre_id_trending', 'genre_id', 'trending'),
+    )
+
+    genre_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    book_id: Mapped[int] = mapped_column(ForeignKey('books.id', ondelete='CASCADE'), primary_key=True, index=True)
+    bayesian_rating: Mapped[float] = mapped_column(Float, nullable=False)
+    # Сумма 2 ** ((время рецензии - trending_epoch) / период полураспада): старые рецензии не пересчитываются
+    trending: Mapped[float] = mapped_column(Double, nullable=False, default=0)
+
+class LeaderboardState(Base):
+    # Общие для всех строк book_rankings параметры; пишутся только командами flask leaderboards
+    __tablename__ = 'leaderboard_state'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    prior_mean: Mapped[float] = mapped_column(Float, nullable=False)
+    prior_weight: Mapped[float] = mapped_column(Float, nullable=False)
+    trending_epoch: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=False)
+
+class ThrottleBucket(Base):
+    # Общее состояние token bucket для ограничения попыток входа (LOGIN_THROTTLE_BACKEND = 'database')
+    __tablename__ = 'throttle_buckets'
+
+    bucket: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Double: в одинарной точности MySQL FLOAT секунды эпохи округляются до 128 с
+    tokens: Mapped[float] = mapped_column(Double, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Double, nullable=False)
+
+class CacheGeneration(Base):
+    # Номер поколения кэша: меняется в той же транзакции, что и данные, от которых зависит кэш
+    __tablename__ = 'cache_generations'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+def bump_version(mapper, connection, target):
+    # Версия строки растёт при любом изменении через ORM, включая состав связей многие-ко-многим
+    target.version = (target.version or 0) + 1
+
+for versioned in (Book, Review, Collection):
+    event.listen(versioned, 'before_update', bump_version)
 
 collection_book_table = Table('collection_book', Base.metadata,
     Column('collection_id', Integer, ForeignKey('collections.id', ondelete="CASCADE"), primary_key=True),
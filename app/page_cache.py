@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import tempfile
+from flask import current_app, g, has_request_context
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session
+from cache import LRUCache
+from models import db, Book, Genre, Review, CacheGeneration
+
+CATALOG = 'catalog'
+# Изменение этих моделей меняет содержимое страниц каталога
+CATALOG_MODELS = (Book, Genre, Review)
+# Права, от которых зависит разметка фрагмента каталога
+CATALOG_ACTIONS = ('create_book', 'edit_book', 'delete_book', 'add_collection')
+# Раз в столько записей файловый кэш удаляет устаревшие файлы
+PRUNE_EVERY = 100
+
+class MemoryBackend:
+    # Кэш в памяти процесса
+    def __init__(self, maxsize=512, ttl=300):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def clear(self):
+        self._cache.clear()
+
+class FileSystemBackend:
+    # Локальная замена общего кэша (Redis/memcached): каталог на диске, общий для всех воркеров хоста.
+    # Хранится только текст фрагмента: первая строка - срок годности, остальное - HTML
+    def __init__(self, directory, ttl=300, prune_every=PRUNE_EVERY):
+        self.directory = directory
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Каталог, созданный раньше или другим пользователем, тоже закрывается от чужих процессов
+        os.chmod(directory, 0o700)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                expires_at, _, value = f.read().partition('\n')
+            expired = float(expires_at) < time.time()
+        except (OSError, ValueError):
+            return None
+        if expired:
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, value):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.cache-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(f'{time.time() + self.ttl}\n{value}')
+        os.replace(temp_path, self._path(key))
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        # Записи старых поколений больше никто не читает, поэтому устаревшие файлы удаляются по mtime
+        deadline = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < deadline:
+                    self._remove(entry.path)
+            except OSError:
+                pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+_backends = {}
+
+def get_backend():
+    name = current_app.config.get('PAGE_CACHE_BACKEND', 'memory')
+    if not name:
+        return None
+    if current_app not in _backends:
+        ttl = current_app.config.get('PAGE_CACHE_TTL', 300)
+        if name == 'filesystem':
+            # Общий каталог во временной папке могли бы подложить другие пользователи хоста
+            directory = current_app.config.get('PAGE_CACHE_DIR')
+            if not directory:
+                raise RuntimeError('Для PAGE_CACHE_BACKEND = "filesystem" нужно указать PAGE_CACHE_DIR')
+            _backends[current_app] = FileSystemBackend(directory, ttl=ttl)
+        else:
+            _backends[current_app] = MemoryBackend(maxsize=current_app.config.get('PAGE_CACHE_SIZE', 512), ttl=ttl)
+    return _backends[current_app]
+
+def generation(name):
+    value = db.session.execute(select(CacheGeneration.value).where(CacheGeneration.name == name)).scalar()
+    return value or 0
+
+def request_generation(name):
+    # Несколько фрагментов одной страницы читают поколение один раз
+    if not has_request_context():
+        return generation(name)
+    generations = g.setdefault('cache_generations', {})
+    if name not in generations:
+        generations[name] = generation(name)
+    return generations[name]
+
+def bump_generation(connection, name):
+    result = connection.execute(
+        update(CacheGeneration).where(CacheGeneration.name == name).values(value=CacheGeneration.value + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(CacheGeneration).values(name=name, value=1))
+
+@event.listens_for(Session, 'before_flush')
+def invalidate_catalog(session, flush_context, instances):
+    # Любое изменение книг, жанров или рецензий сдвигает поколение каталога в той же транзакции,
+    # поэтому закэшированная до этого страница больше не будет выдана ни одним процессом
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, CATALOG_MODELS) for obj in changed):
+        if not session.info.get('catalog_bumped'):
+            bump_generation(session.connection(), CATALOG)
+            session.info['catalog_bumped'] = True
+            if has_request_context():
+                g.pop('cache_generations', None)
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def reset_bump_flag(session):
+    session.info.pop('catalog_bumped', None)
+
+def permission_profile():
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    return 'user:' + ''.join('1' if current_user.can(action) else '0' for action in CATALOG_ACTIONS)
+
+def cached_fragment(name, parts, build):
+    # build() рендерит фрагмент; ключ включает поколение, поэтому явное удаление записей не нужно
+    backend = get_backend()
+    if backend is None:
+        return Markup(build())
+    key = repr((name, request_generation(CATALOG), permission_profile()) + tuple(parts))
+    html = backend.get(key)
+    if html is None:
+        html = str(build())
+        backend.set(key, html)
+    return Markup(html)
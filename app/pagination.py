@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from models import db
+
+class KeysetPage:
+    # Страница, выбранная по ключу (seek) вместо OFFSET; порядок по всем колонкам - убывающий
+    def __init__(self, items, columns, has_prev, has_next):
+        self.items = items
+        self.columns = columns
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return encode_cursor('prev', self.columns, self.items[0])
+        return None
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return encode_cursor('next', self.columns, self.items[-1])
+        return None
+
+def encode_cursor(direction, columns, item):
+    values = [getattr(item, column.key) for column in columns]
+    payload = json.dumps([direction] + values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, *values = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('prev', 'next') or len(values) != len(columns):
+            return None
+        values = [decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        return None
+    return direction, values
+
+def decode_value(column, value):
+    # Курсор приходит от клиента: значение обязано иметь тип колонки, иначе отдаётся первая страница
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is float and type(value) is int:
+        return float(value)
+    if type(value) is not python_type:
+        raise TypeError(f'{column.key}: ожидался {python_type.__name__}')
+    return value
+
+def seek_condition(columns, values, direction):
+    # (c1, c2, ...) < (v1, v2, ...) в развёрнутом виде, чтобы работал индекс на любой СУБД
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal_prefix = [c == v for c, v in zip(columns[:i], values[:i])]
+        compare = column < value if direction == 'next' else column > value
+        conditions.append(and_(*equal_prefix, compare))
+    return or_(*conditions)
+
+def keyset_query(query, columns, cursor=None, per_page=10):
+    # Запрос страницы (на одну строку больше, чтобы узнать о следующей) и разобранный курсор
+    decoded = decode_cursor(cursor, columns) if cursor else None
+    direction = 'next'
+    if decoded:
+        direction, values = decoded
+        query = query.where(seek_condition(columns, values, direction))
+
+    if direction == 'next':
+        query = query.order_by(*[column.desc() for column in columns])
+    else:
+        query = query.order_by(*[column.asc() for column in columns])
+    return query.limit(per_page + 1), decoded
+
+def keyset_page(items, columns, decoded, per_page):
+    direction = decoded[0] if decoded else 'next'
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'next':
+        has_prev, has_next = decoded is not None, has_more
+    else:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    return KeysetPage(items, columns, has_prev, has_next)
+
+def keyset_paginate(query, columns, cursor=None, per_page=10):
+    page_query, decoded = keyset_query(query, columns, cursor, per_page)
+    items = list(db.session.execute(page_query).scalars())
+    return keyset_page(items, columns, decoded, per_page)
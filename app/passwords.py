@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Параметры werkzeug по умолчанию; смена PASSWORD_HASH_METHOD перехэширует пароли при следующем входе
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+class HashingBusy(Exception):
+    pass
+
+class HashingPool:
+    # scrypt и pbkdf2 отпускают GIL, поэтому потоков достаточно; очередь ограничена,
+    # чтобы волна попыток входа не занимала все воркеры веб-сервера
+    def __init__(self, workers, queue_depth):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(queue_depth)
+
+    def run(self, fn, *args, timeout=None):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        # Слот освобождается, только когда хэш действительно посчитан, даже если клиент не дождался
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise HashingBusy()
+
+_pools = {}
+
+def get_pool():
+    app = current_app._get_current_object()
+    if app not in _pools:
+        _pools[app] = HashingPool(app.config.get('PASSWORD_HASH_WORKERS', 2), app.config.get('PASSWORD_HASH_QUEUE', 16))
+    return _pools[app]
+
+def hash_method():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+    return DEFAULT_HASH_METHOD
+
+def hash_password(password):
+    return generate_password_hash(password, hash_method())
+
+@lru_cache(maxsize=8)
+def method_prefix(method):
+    # werkzeug дополняет параметры по умолчанию ('scrypt' -> 'scrypt:32768:8:1'), поэтому берём их из настоящего хэша
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != method_prefix(hash_method())
+
+def verify_password(password_hash, password):
+    timeout = current_app.config.get('PASSWORD_HASH_TIMEOUT', 5)
+    return get_pool().run(check_password_hash, password_hash, password, timeout=timeout)
+
+def rehash_password(password):
+    timeout = current_app.config.get('PASSWORD_HASH_TIMEOUT', 5)
+    return get_pool().run(generate_password_hash, password, hash_method(), timeout=timeout)
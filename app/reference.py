@@ -0,0 +1,30 @@
+from collections import namedtuple
+from sqlalchemy import event, select
+from cache import LRUCache
+from models import db, Genre
+
+GenreChoice = namedtuple('GenreChoice', 'id name')
+
+# Справочник жанров для форм книг: меняется редко, в основном при импорте каталога
+reference_cache = LRUCache(maxsize=16, ttl=300)
+
+def init_reference_data(app):
+    reference_cache.ttl = app.config.get('REFERENCE_CACHE_TTL', 300)
+
+def genre_choices():
+    genres = reference_cache.get('genres')
+    if genres is None:
+        genres = [GenreChoice(*row) for row in db.session.execute(select(Genre.id, Genre.name).order_by(Genre.id))]
+        reference_cache.set('genres', genres)
+    return genres
+
+def warm_reference_data():
+    # Роли не кэшируются: права проверяются по id ролей из configure.py без запросов к roles
+    genre_choices()
+
+@event.listens_for(Genre, 'after_insert')
+@event.listens_for(Genre, 'after_update')
+@event.listens_for(Genre, 'after_delete')
+def invalidate_genres(mapper, connection, target):
+    # Другие процессы увидят изменение не позже чем через REFERENCE_CACHE_TTL
+    reference_cache.delete('genres')
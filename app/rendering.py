@@ -0,0 +1,78 @@
+import hashlib
+import threading
+import bleach
+from markdown2 import Markdown
+from cache import LRUCache
+from instrumentation import timed
+
+ALLOWED_TAGS = list(bleach.sanitizer.ALLOWED_TAGS) + [
+    'p', 'strong', 'em', 'ul', 'ol', 'li', 'a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'br', 'blockquote', 'code', 'pre'
+]
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title', 'target'],
+    'img': ['src', 'alt', 'title']
+}
+
+class MarkdownRenderer:
+    # Markdown -> безопасный HTML с LRU-кэшем по хэшу исходного текста.
+    # Экземпляры Markdown и bleach.Cleaner не потокобезопасны, поэтому свои на каждый поток.
+    def __init__(self, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, maxsize=1024):
+        self.tags = tags
+        self.attributes = attributes
+        self._cache = LRUCache(maxsize)
+        self._local = threading.local()
+
+    @property
+    def _cleaner(self):
+        cleaner = getattr(self._local, 'cleaner', None)
+        if cleaner is None:
+            cleaner = self._local.cleaner = bleach.Cleaner(tags=self.tags, attributes=self.attributes)
+        return cleaner
+
+    @property
+    def _markdown(self):
+        markdown = getattr(self._local, 'markdown', None)
+        if markdown is None:
+            markdown = self._local.markdown = Markdown()
+        return markdown
+
+    @staticmethod
+    def content_key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def sanitize(self, html):
+        with timed('bleach'):
+            return self._cleaner.clean(html)
+
+    def render(self, text):
+        text = text or ''
+        key = self.content_key(text)
+        html = self._cache.get(key)
+        if html is None:
+            with timed('markdown'):
+                converted = self._markdown.convert(text)
+            html = self.sanitize(converted)
+            self._cache.set(key, html)
+        return html
+
+    def render_many(self, texts):
+        # Одинаковые тексты в пакете рендерятся один раз
+        rendered = {}
+        result = []
+        for text in texts:
+            key = self.content_key(text or '')
+            if key not in rendered:
+                rendered[key] = self.render(text)
+            result.append(rendered[key])
+        return result
+
+    def sanitize_many(self, fragments):
+        return [self.sanitize(fragment or '') for fragment in fragments]
+
+    def clear(self):
+        self._cache.clear()
+
+renderer = MarkdownRenderer()
+
+def render_markdown(text):
+    return renderer.render(text)
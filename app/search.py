@@ -0,0 +1,24 @@
+from flask import Blueprint, render_template, request
+from sqlalchemy.orm import selectinload
+from models import db, Book
+from search_index import get_search_backend
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+PER_PAGE = 10
+
+@bp.route('/', methods=['GET'])
+def search_books():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    books = []
+    has_next = False
+    if query:
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        hits = get_search_backend().search(query, limit=PER_PAGE + 1, offset=(page - 1) * PER_PAGE)
+        has_next = len(hits) > PER_PAGE
+        ids = [book_id for book_id, _ in hits[:PER_PAGE]]
+        found = db.session.query(Book).options(selectinload(Book.genres)).filter(Book.id.in_(ids)).all()
+        by_id = {book.id: book for book in found}
+        books = [by_id[book_id] for book_id in ids if book_id in by_id]
+    return render_template('search/results.html', query=query, books=books, page=page, has_next=has_next)
@@ -0,0 +1,152 @@
+import re
+from abc import ABC, abstractmethod
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import text, select, or_
+from models import db, Book
+
+SEARCH_TABLE = 'book_search'
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Поисковые таблицы (и служебные таблицы FTS5) создаются вне моделей - autogenerate их не трогает
+    if type_ == 'table' and name.startswith(SEARCH_TABLE):
+        return False
+    return True
+
+def book_document(book):
+    return {
+        'book_id': book.id,
+        'title': book.title or '',
+        'author': book.author or '',
+        'publisher': book.publisher or '',
+        'body': Markup(book.description or '').striptags(),
+    }
+
+class SearchBackend(ABC):
+    # Индекс хранится в отдельной таблице book_search и обновляется в транзакции изменения книги
+    # Таблицу создаёт миграция a9d3f61c8e25; schema нужна базам, созданным без миграций
+    schema = ()
+
+    def ensure_schema(self):
+        # Отдельное соединение: DDL в MySQL неявно фиксирует текущую транзакцию
+        with db.engine.begin() as connection:
+            for statement in self.schema:
+                connection.execute(text(statement))
+
+    def index_books(self, books):
+        documents = [book_document(book) for book in books]
+        if not documents:
+            return
+        db.session.execute(
+            text(f'DELETE FROM {SEARCH_TABLE} WHERE book_id = :book_id'),
+            [{'book_id': document['book_id']} for document in documents],
+        )
+        db.session.execute(
+            text(f'INSERT INTO {SEARCH_TABLE} (book_id, title, author, publisher, body) '
+                 'VALUES (:book_id, :title, :author, :publisher, :body)'),
+            documents,
+        )
+
+    def index_book(self, book):
+        self.index_books([book])
+
+    def remove_book(self, book_id):
+        db.session.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE book_id = :book_id'), {'book_id': book_id})
+
+    def clear(self):
+        db.session.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+
+    @abstractmethod
+    def search(self, query, limit=10, offset=0):
+        # Список (book_id, score) по убыванию релевантности
+        ...
+
+class MySQLFullTextBackend(SearchBackend):
+    schema = (
+        f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+        'book_id INTEGER NOT NULL PRIMARY KEY, '
+        'title VARCHAR(100) NOT NULL, author VARCHAR(100) NOT NULL, '
+        'publisher VARCHAR(100) NOT NULL, body TEXT NOT NULL, '
+        'FULLTEXT INDEX ix_book_search_fulltext (title, author, publisher, body)'
+        ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4',
+    )
+
+    def search(self, query, limit=10, offset=0):
+        rows = db.session.execute(
+            text(f'SELECT book_id, MATCH(title, author, publisher, body) AGAINST (:query) AS score '
+                 f'FROM {SEARCH_TABLE} '
+                 'WHERE MATCH(title, author, publisher, body) AGAINST (:query) '
+                 'ORDER BY score DESC, book_id DESC LIMIT :limit OFFSET :offset'),
+            {'query': query, 'limit': limit, 'offset': offset},
+        )
+        return [(row.book_id, row.score) for row in rows]
+
+class SQLiteFTS5Backend(SearchBackend):
+    schema = (
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+        'USING fts5(book_id UNINDEXED, title, author, publisher, body)',
+    )
+    # Веса столбцов для bm25: совпадение в названии важнее, чем в описании
+    weights = (0.0, 10.0, 5.0, 2.0, 1.0)
+
+    @staticmethod
+    def match_expression(query):
+        # Пользовательский ввод превращаем в набор префиксных термов, чтобы не ломать синтаксис FTS5
+        terms = re.findall(r'\w+', query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, query, limit=10, offset=0):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        rows = db.session.execute(
+            text(f'SELECT book_id, -bm25({SEARCH_TABLE}, {weights}) AS score '
+                 f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query '
+                 'ORDER BY score DESC, book_id DESC LIMIT :limit OFFSET :offset'),
+            {'query': expression, 'limit': limit, 'offset': offset},
+        )
+        return [(int(row.book_id), row.score) for row in rows]
+
+class LikeSearchBackend(SearchBackend):
+    # Запасной вариант для СУБД без полнотекстового индекса: LIKE по полям книги, таблица индекса не ведётся
+    def index_books(self, books):
+        pass
+
+    def remove_book(self, book_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit=10, offset=0):
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        conditions = [
+            or_(*(column.icontains(term, autoescape=True) for column in (Book.title, Book.author, Book.publisher)))
+            for term in terms
+        ]
+        rows = db.session.execute(
+            select(Book.id).where(*conditions).order_by(Book.id.desc()).limit(limit).offset(offset)
+        )
+        return [(book_id, 1.0) for book_id in rows.scalars()]
+
+SEARCH_BACKENDS = {
+    'mysql': MySQLFullTextBackend,
+    'sqlite': SQLiteFTS5Backend,
+    'like': LikeSearchBackend,
+}
+
+_backends = {}
+
+def get_search_backend():
+    # Бэкенд выбирается по диалекту движка, можно переопределить через SEARCH_BACKEND
+    name = current_app.config.get('SEARCH_BACKEND') or db.engine.dialect.name
+    if name not in SEARCH_BACKENDS:
+        # На других СУБД запись книг не должна падать из-за поиска
+        name = 'like'
+    key = (name, db.engine)
+    if key not in _backends:
+        _backends[key] = SEARCH_BACKENDS[name]()
+    return _backends[key]
@@ -0,0 +1,153 @@
+from flask import current_app
+from sqlalchemy import select, delete, or_
+from models import db, Book, BookSimilarity, SimilarityQueue, book_genre_table, collection_book_table
+from tools import insert_ignore
+
+# numpy и scipy загружает load_numpy: веб-воркеры их не импортируют
+np = sparse = None
+
+def load_numpy():
+    global np, sparse
+    if np is None:
+        try:
+            import numpy
+            from scipy import sparse as scipy_sparse
+        except ImportError:
+            raise RuntimeError('Для расчёта похожих книг нужны numpy и scipy')
+        np, sparse = numpy, scipy_sparse
+
+def mark_books_changed(book_ids):
+    # Вызывается в транзакции изменения: пересчёт выполнит flask similar refresh
+    rows = [{'book_id': book_id} for book_id in set(book_ids)]
+    if rows:
+        db.session.execute(insert_ignore(SimilarityQueue.__table__), rows)
+
+def similar_books(book_id, limit):
+    return db.session.execute(
+        select(Book.id, Book.title)
+        .join(BookSimilarity, BookSimilarity.similar_book_id == Book.id)
+        .where(BookSimilarity.book_id == book_id)
+        .order_by(BookSimilarity.score.desc())
+        .limit(limit)
+    ).all()
+
+def normalized_membership(pairs, book_ids):
+    # Разреженная матрица книга x группа с единичными строками: произведение строк даёт косинус
+    pairs = pairs[np.isin(pairs[:, 0], book_ids)] if len(pairs) else pairs
+    if not len(pairs):
+        return sparse.csr_matrix((len(book_ids), 0))
+    rows = np.searchsorted(book_ids, pairs[:, 0])
+    groups, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix((np.ones(len(pairs)), (rows, columns)), shape=(len(book_ids), len(groups)))
+    norms = np.sqrt(np.asarray(matrix.sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+class SimilarityIndex:
+    # Оценка = w * косинус по общим подборкам + (1 - w) * косинус по общим жанрам
+    def __init__(self, collection_weight, limit):
+        self.limit = limit
+        self.book_ids = np.array(db.session.execute(select(Book.id).order_by(Book.id)).scalars().all(), dtype=np.int64)
+        collections = np.array(db.session.execute(
+            select(collection_book_table.c.book_id, collection_book_table.c.collection_id)).all(), dtype=np.int64)
+        genres = np.array(db.session.execute(
+            select(book_genre_table.c.book_id, book_genre_table.c.genre_id)).all(), dtype=np.int64)
+        self.collections = normalized_membership(collections.reshape(-1, 2), self.book_ids)
+        self.collections_t = self.collections.T.tocsr()
+        self.genres = normalized_membership(genres.reshape(-1, 2), self.book_ids)
+        self.genres_t = self.genres.T.tocsr()
+        self.collection_weight = collection_weight
+
+    def top(self, book_ids, batch_size=500):
+        # {book_id: [(similar_book_id, score), ...]} для книг, которые ещё есть в каталоге
+        book_ids = np.asarray(sorted(book_ids), dtype=np.int64)
+        book_ids = book_ids[np.isin(book_ids, self.book_ids)]
+        result = {}
+        for start in range(0, len(book_ids), batch_size):
+            result.update(self.top_batch(book_ids[start:start + batch_size]))
+        return result
+
+    def related(self, book_ids):
+        # Книги с общей подборкой или жанром хоть с одной из book_ids: только у них меняется оценка с ними
+        book_ids = np.asarray(sorted(book_ids), dtype=np.int64)
+        book_ids = book_ids[np.isin(book_ids, self.book_ids)]
+        if not len(book_ids):
+            return set()
+        index = np.searchsorted(self.book_ids, book_ids)
+        shared = (self.collections[index] @ self.collections_t + self.genres[index] @ self.genres_t).tocsr()
+        return {int(book_id) for book_id in self.book_ids[np.unique(shared.indices)]}
+
+    def top_batch(self, book_ids):
+        index = np.searchsorted(self.book_ids, book_ids)
+        scores = (
+            self.collection_weight * (self.collections[index] @ self.collections_t)
+            + (1 - self.collection_weight) * (self.genres[index] @ self.genres_t)
+        ).tocsr()
+        result = {}
+        for row, book_id in enumerate(book_ids):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end]
+            keep = (columns != index[row]) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if len(values) > self.limit:
+                best = np.argpartition(-values, self.limit)[:self.limit]
+                columns, values = columns[best], values[best]
+            order = np.argsort(-values, kind='stable')
+            result[int(book_id)] = [(int(self.book_ids[c]), round(float(v), 6)) for c, v in zip(columns[order], values[order])]
+        return result
+
+def store(tops):
+    db.session.execute(delete(BookSimilarity).where(BookSimilarity.book_id.in_(list(tops))))
+    rows = [
+        {'book_id': book_id, 'similar_book_id': similar_id, 'score': score}
+        for book_id, similar in tops.items()
+        for similar_id, score in similar
+    ]
+    if rows:
+        db.session.execute(BookSimilarity.__table__.insert(), rows)
+
+def build_index():
+    load_numpy()
+    return SimilarityIndex(
+        current_app.config.get('SIMILAR_COLLECTION_WEIGHT', 0.7),
+        current_app.config.get('SIMILAR_BOOKS_STORED', 20),
+    )
+
+def rebuild_similarities(batch_size=500):
+    queued = db.session.execute(select(SimilarityQueue.book_id)).scalars().all()
+    index = build_index()
+    db.session.execute(delete(BookSimilarity))
+    for start in range(0, len(index.book_ids), batch_size):
+        store(index.top_batch(index.book_ids[start:start + batch_size]))
+    # Очередь, накопленная до снимка, покрыта полной пересборкой
+    if queued:
+        db.session.execute(delete(SimilarityQueue).where(SimilarityQueue.book_id.in_(queued)))
+    db.session.commit()
+    return len(index.book_ids)
+
+def refresh_similarities(batch_size=500):
+    # Пересчитываются изменённые книги и все книги, чья оценка с ними была или стала ненулевой:
+    # изменённая книга может войти в топ любой книги с общей подборкой или жанром, а не только своих соседей.
+    # Для популярного жанра это почти весь каталог - тогда дешевле flask similar rebuild
+    queued = db.session.execute(select(SimilarityQueue.book_id)).scalars().all()
+    if not queued:
+        return 0
+    index = build_index()
+    refreshed = 0
+    for start in range(0, len(queued), batch_size):
+        changed = queued[start:start + batch_size]
+        tops = index.top(changed)
+        neighbours = set(db.session.execute(
+            select(BookSimilarity.book_id).where(BookSimilarity.similar_book_id.in_(changed))
+        ).scalars())
+        neighbours.update(index.related(changed))
+        neighbours.difference_update(tops)
+        tops.update(index.top(neighbours))
+        # Удалённые книги пропадают из индекса вместе со ссылками на них
+        db.session.execute(delete(BookSimilarity).where(or_(
+            BookSimilarity.book_id.in_(changed), BookSimilarity.similar_book_id.in_(changed))))
+        store(tops)
+        db.session.execute(delete(SimilarityQueue).where(SimilarityQueue.book_id.in_(changed)))
+        db.session.commit()
+        refreshed += len(tops)
+    return refreshed
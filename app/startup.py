@@ -0,0 +1,37 @@
+import os
+import weakref
+from sqlalchemy.orm import configure_mappers
+from models import db
+from reference import warm_reference_data
+
+# Приложения этого процесса: после fork их движки сбрасываются в дочернем процессе
+_apps = weakref.WeakSet()
+
+def dispose_engines(app, close=True):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+def reset_after_fork():
+    # Соединения, открытые до fork, принадлежат родителю: воркер забывает их, не закрывая,
+    # и открывает свои при первом запросе
+    for app in list(_apps):
+        dispose_engines(app, close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+def warm_up(app):
+    # Работа, которую иначе каждый воркер делает на первых запросах
+    with app.app_context():
+        configure_mappers()
+        for name in app.jinja_env.list_templates(extensions=('html',)):
+            app.jinja_env.get_template(name)
+        warm_reference_data()
+    # К моменту fork в пуле мастера не остаётся соединений
+    dispose_engines(app)
+
+def init_startup(app):
+    _apps.add(app)
+    if app.config.get('PRELOAD_WARMUP', False):
+        warm_up(app)
@@ -0,0 +1,25 @@
+import pytest
+from benchmarks.run import configure_environment
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # configure_environment отключает кэш страниц: бюджет проверяется на настоящем рендеринге
+    configure_environment(str(tmp_path_factory.mktemp('webexam')))
+    from app import create_app
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        seed(books=100, reviews_per_book=5, users=5, collections_per_user=3, books_per_collection=15)
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user_client(client):
+    from benchmarks.seed import PASSWORD
+
+    client.post('/auth/login', data={'login': 'user3', 'password': PASSWORD})
+    return client
@@ -0,0 +1,11 @@
+from contextlib import contextmanager
+from tools import QueryCounter
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    # Падает, если внутри блока выполнено больше запросов, чем разрешено бюджетом
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(counter.statements)
+        raise AssertionError(f'Выполнено {counter.count} SQL-запросов при бюджете {limit}:\n{statements}')
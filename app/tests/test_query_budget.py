@@ -0,0 +1,36 @@
+import re
+import pytest
+from models import db
+from tests.support import assert_max_queries
+
+# Подборка 7 принадлежит user3 (seed: три подборки на пользователя)
+COLLECTION_ID = 7
+
+def get(app, client, url, limit):
+    with app.app_context():
+        engine = db.engine
+    with assert_max_queries(limit, engine):
+        response = client.get(url)
+    assert response.status_code == 200
+    return response
+
+def test_index(app, client):
+    get(app, client, '/', 7)
+
+def test_index_next_page(app, client):
+    html = client.get('/').get_data(as_text=True)
+    next_page = re.search(r'href="(/\?cursor=[^"]+)"[^>]*>Следующая', html).group(1)
+    get(app, client, next_page, 7)
+
+def test_index_authenticated(app, user_client):
+    # Бюджет включает загрузку пользователя, если его снимок ещё не в кэше
+    get(app, user_client, '/', 9)
+
+def test_show_book(app, user_client):
+    get(app, user_client, '/book/show_book/50', 6)
+
+@pytest.mark.parametrize('per_page', [5, 15])
+def test_current_collection(app, user_client, per_page):
+    # Число запросов не зависит от числа книг на странице
+    app.config['COLLECTION_BOOKS_PER_PAGE'] = per_page
+    get(app, user_client, f'/collection/current_collection/{COLLECTION_ID}', 4)
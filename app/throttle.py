@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select, update, insert, delete, case
+from sqlalchemy.exc import IntegrityError
+from cache import LRUCache
+from models import db, ThrottleBucket
+
+def retry_after(tokens, rate):
+    return max(1, math.ceil((1 - tokens) / rate))
+
+class MemoryBuckets:
+    # Token bucket в памяти процесса: у каждого воркера свой счётчик
+    def __init__(self, maxsize=100000):
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, bucket, burst, rate, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.get(bucket) or (burst, now)
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets.set(bucket, (tokens, now))
+        return allowed, 0 if allowed else retry_after(tokens, rate)
+
+class DatabaseBuckets:
+    # Общие для всех воркеров и хостов ведра в таблице throttle_buckets; списание - один условный UPDATE
+    def take(self, bucket, burst, rate, now=None):
+        now = time.time() if now is None else now
+        refilled = ThrottleBucket.tokens + (now - ThrottleBucket.updated_at) * rate
+        capped = case((refilled > burst, burst), else_=refilled)
+        for _ in range(2):
+            with db.engine.begin() as connection:
+                taken = connection.execute(
+                    update(ThrottleBucket)
+                    .where(ThrottleBucket.bucket == bucket, capped >= 1)
+                    .values(tokens=capped - 1, updated_at=now)
+                ).rowcount
+                if taken:
+                    return True, 0
+                row = connection.execute(
+                    select(ThrottleBucket.tokens, ThrottleBucket.updated_at).where(ThrottleBucket.bucket == bucket)
+                ).first()
+            if row is not None:
+                return False, retry_after(min(burst, row.tokens + (now - row.updated_at) * rate), rate)
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(ThrottleBucket).values(bucket=bucket, tokens=burst - 1, updated_at=now))
+                return True, 0
+            except IntegrityError:
+                # Ведро успел создать параллельный запрос - повторяем списание
+                continue
+        return False, 1
+
+    def prune(self, max_idle):
+        # Ведро, не тронутое дольше времени полного пополнения, равно новому - строку можно удалить
+        with db.engine.begin() as connection:
+            return connection.execute(
+                delete(ThrottleBucket).where(ThrottleBucket.updated_at < time.time() - max_idle)
+            ).rowcount
+
+_backends = {}
+
+def get_backend():
+    name = current_app.config.get('LOGIN_THROTTLE_BACKEND', 'memory')
+    if not name:
+        return None
+    if current_app not in _backends:
+        _backends[current_app] = DatabaseBuckets() if name == 'database' else MemoryBuckets()
+    return _backends[current_app]
+
+def login_throttled(remote_addr, username):
+    # Возвращает, через сколько секунд можно повторить попытку, или 0
+    backend = get_backend()
+    if backend is None:
+        return 0
+    limits = (
+        (f'ip:{remote_addr}', current_app.config.get('LOGIN_RATE_PER_IP', (30, 10))),
+        (f'user:{username}', current_app.config.get('LOGIN_RATE_PER_USER', (10, 5))),
+    )
+    # (burst, попыток в минуту)
+    for bucket, (burst, per_minute) in limits:
+        allowed, wait = backend.take(bucket, burst, per_minute / 60)
+        if not allowed:
+            return wait
+    return 0
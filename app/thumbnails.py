@@ -0,0 +1,79 @@
+import os
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Размеры производных обложек: миниатюра для списков и средний размер для страницы книги
+COVER_SIZES = {
+    'thumb': (100, 150),
+    'medium': (300, 450),
+}
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+def current_umask():
+    # Узнать umask можно только установив новый; модуль импортируется до запуска потоков
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Права, которые дал бы файлу обычный open(): обложки читает и сервер за X-Accel-Redirect/X-Sendfile
+FILE_MODE = 0o666 & ~current_umask()
+
+def replace_file(temp_path, target_path):
+    # mkstemp создаёт файл с правами 0600 - перед публикацией возвращаем обычные
+    os.chmod(temp_path, FILE_MODE)
+    os.replace(temp_path, target_path)
+
+def derivative_filename(storage_filename, size):
+    name, ext = os.path.splitext(storage_filename)
+    return f"{name}.{size}{ext}"
+
+def render_derivatives(upload_folder, storage_filename):
+    # Выполняется в отдельном процессе, поэтому не обращается ни к Flask, ни к БД
+    source_path = os.path.join(upload_folder, storage_filename)
+    with Image.open(source_path) as source:
+        for size, box in COVER_SIZES.items():
+            target_path = os.path.join(upload_folder, derivative_filename(storage_filename, size))
+            if os.path.exists(target_path):
+                continue
+            image = source.copy()
+            image.thumbnail(box)
+            fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.derivative-')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    image.save(temp_file, format=source.format)
+                replace_file(temp_path, target_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = current_app.config.get('THUMBNAIL_WORKERS', 2)
+        # spawn: дочерние процессы не наследуют соединения с БД и потоки веб-сервера
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def schedule_derivatives(storage_filename):
+    if Image is None or not current_app.config.get('THUMBNAILS_ENABLED', True):
+        return None
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    future = get_executor().submit(render_derivatives, upload_folder, storage_filename)
+    future.add_done_callback(log_derivative_failure)
+    return future
+
+def log_derivative_failure(future):
+    error = future.exception()
+    if error is not None:
+        # Обложка по-прежнему отдаётся в оригинальном размере
+        logger.warning('Не удалось создать миниатюры обложки: %s', error)
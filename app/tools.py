@@ -1,37 +1,134 @@
 import os
 import hashlib
+import tempfile
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, sqlite
 from models import db, Cover
+from thumbnails import schedule_derivatives, replace_file
 from flask import current_app
 
+DEFAULT_COVER_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_COVER_MIME_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+CHUNK_SIZE = 64 * 1024
+
+# Сигнатуры начала файла для проверки, что загружено действительно изображение
+IMAGE_SIGNATURES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/webp': (b'RIFF',),
+}
+
+class ImageValidationError(ValueError):
+    pass
+
 class ImageSaver:
     def __init__(self, file):
         self.file = file
 
+    def _check_mime_type(self, first_chunk):
+        mime_type = self.file.mimetype
+        allowed = current_app.config.get('COVER_ALLOWED_MIME_TYPES', DEFAULT_COVER_MIME_TYPES)
+        if mime_type not in allowed:
+            raise ImageValidationError(f'Недопустимый тип файла обложки: {mime_type}')
+        signatures = IMAGE_SIGNATURES.get(mime_type)
+        if signatures and not first_chunk.startswith(signatures):
+            raise ImageValidationError('Содержимое файла не соответствует типу изображения')
+
+    def stream_to_temp(self, upload_folder):
+        # Файл читается по частям: хэш считается на лету, данные сразу пишутся на диск
+        max_size = current_app.config.get('COVER_MAX_SIZE', DEFAULT_COVER_MAX_SIZE)
+        md5 = hashlib.md5()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                chunk = self.file.stream.read(CHUNK_SIZE)
+                self._check_mime_type(chunk)
+                while chunk:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ImageValidationError(f'Размер обложки превышает {max_size // 1024} КБ')
+                    md5.update(chunk)
+                    temp_file.write(chunk)
+                    chunk = self.file.stream.read(CHUNK_SIZE)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, md5.hexdigest()
+
+    def storage_filename(self, md5_hash):
+        ext = os.path.splitext(self.file.filename)[1]
+        return f"{md5_hash}{ext}"
+
     def save(self):
         filename = self.file.filename
         mime_type = self.file.mimetype
-        file_data = self.file.read()
-        
-        # Вычисляем MD5-хэш файла
-        md5_hash = hashlib.md5(file_data).hexdigest()
-        
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+
+        temp_path, md5_hash = self.stream_to_temp(upload_folder)
+
         # Проверяем, существует ли изображение с таким же хэшем
         existing_cover = db.session.query(Cover).filter_by(md5_hash=md5_hash).first()
         if existing_cover:
+            os.remove(temp_path)
+            # Отметка о повторном использовании защищает обложку от сборщика, пока книга не сохранена
+            existing_cover.last_used_at = datetime.utcnow()
+            db.session.commit()
             return existing_cover
-        
-        # Если изображение не найдено, сохраняем новый файл
-        ext = os.path.splitext(filename)[1]
-        storage_filename = f"{md5_hash}{ext}"
-        
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        filepath = os.path.join(upload_folder, storage_filename)
-        
-        with open(filepath, 'wb') as f:
-            f.write(file_data)
-        
+
+        # Если изображение не найдено, атомарно переименовываем временный файл
+        storage_filename = self.storage_filename(md5_hash)
+        replace_file(temp_path, os.path.join(upload_folder, storage_filename))
+
         cover = Cover(filename=filename, mime_type=mime_type, md5_hash=md5_hash)
         db.session.add(cover)
         db.session.commit()
-        
+
+        # Миниатюры готовятся в фоне, до их появления отдаётся оригинал
+        schedule_derivatives(storage_filename)
+
         return cover
+
+def insert_ignore(table):
+    # INSERT, пропускающий строки с уже существующим ключом
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        return mysql.insert(table).prefix_with('IGNORE')
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    raise RuntimeError(f'INSERT с пропуском дубликатов не поддерживается для {dialect}')
+
+def upsert(table, rows, keys, update):
+    # INSERT, обновляющий существующую строку; update(new) возвращает SET, new - значения вставляемой строки
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table).values(rows)
+        return statement.on_duplicate_key_update(update(statement.inserted))
+    if dialect == 'sqlite':
+        statement = sqlite.insert(table).values(rows)
+        return statement.on_conflict_do_update(index_elements=keys, set_=update(statement.excluded))
+    raise RuntimeError(f'INSERT с обновлением не поддерживается для {dialect}')
+
+class QueryCounter:
+    # Считает SQL-запросы, выполненные движком внутри блока with
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.engine = self.engine or db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False